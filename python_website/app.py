@@ -1,9 +1,30 @@
-from flask import Flask, render_template, jsonify
+from flask import Flask, render_template, jsonify, request, abort, send_from_directory
 from datetime import datetime, timedelta
+import atexit
+import hmac
+import os
 import random
 from database import db
+from assets import init_assets
+from fleet import fleet
+from dashboard_snapshot import DashboardSnapshot
+from feed_analytics import MAX_DAYS, AnalyticsPending, FeedAnalytics
+from profiling import init_profiling, list_profiles
 
 app = Flask(__name__)
+init_assets(app)
+init_profiling(app)
+
+def require_admin():
+    """Only allow admin routes with ADMIN_TOKEN, or in debug mode when it is unset"""
+    token = os.getenv('ADMIN_TOKEN')
+    if not token:
+        if not app.debug:
+            abort(403)
+        return
+    supplied = request.headers.get('X-Admin-Token') or request.args.get('token', '')
+    if not hmac.compare_digest(supplied, token):
+        abort(403)
 
 # Fallback function for when database is not available
 def generate_fallback_sensor_data():
@@ -111,9 +132,31 @@ def feeding_systems():
     
     return render_template('feeding_systems.html', feeding_schedule=feeding_schedule)
 
-@app.route('/dashboard')
-def dashboard():
-    """Dashboard demo page route"""
+feed_analytics = FeedAnalytics(
+    db, refresh_seconds=float(os.getenv('FEED_ANALYTICS_REFRESH_SECONDS', '300'))
+)
+
+@app.route('/api/analytics/feeding')
+def api_feeding_analytics():
+    """API endpoint for per-tank daily feed, FCR and feed response curves"""
+    if not db.client:
+        return jsonify({'error': 'Database unavailable'}), 503
+    
+    days = request.args.get('days', 90, type=int)
+    if days < 1 or days > MAX_DAYS:
+        return jsonify({'error': f'days must be between 1 and {MAX_DAYS}'}), 400
+    
+    try:
+        return jsonify(feed_analytics.get_report(days, request.args.get('tank')))
+    except AnalyticsPending as e:
+        # Older history is still being aggregated; the page retries shortly
+        return jsonify({'status': 'pending', 'message': str(e)}), 202
+    except Exception as e:
+        print(f"❌ Error computing feed analytics: {e}")
+        return jsonify({'error': 'Feed analytics unavailable'}), 503
+
+def build_dashboard_view():
+    """Build the dashboard view model shared by every viewer"""
     # Try to get data from MongoDB
     if db.client:
         current_data = db.get_latest_sensor_data()
@@ -173,10 +216,31 @@ def dashboard():
             {'type': 'success', 'message': 'Water quality parameters optimal', 'time': '4 hours ago'}
         ]
     
+    return {
+        'current_data': current_data,
+        'chart_data': chart_data,
+        'alerts': alerts
+    }
+
+dashboard_snapshot = DashboardSnapshot(
+    db, build_dashboard_view,
+    interval_seconds=float(os.getenv('DASHBOARD_SNAPSHOT_INTERVAL', '5'))
+)
+db.on_sensor_data_change(dashboard_snapshot.notify_change)
+
+@app.route('/dashboard')
+def dashboard():
+    """Dashboard demo page route"""
+    view = dashboard_snapshot.get()
     return render_template('dashboard.html', 
-                         current_data=current_data, 
-                         chart_data=chart_data, 
-                         alerts=alerts)
+                         current_data=view['current_data'], 
+                         chart_data=view['chart_data'], 
+                         alerts=view['alerts'])
+
+@app.route('/api/dashboard')
+def api_dashboard():
+    """API endpoint for the precomputed dashboard view model"""
+    return jsonify(dashboard_snapshot.get())
 
 @app.route('/support')
 def support():
@@ -201,9 +265,45 @@ def api_sensor_data():
     # Fallback to generated data
     return jsonify(generate_fallback_sensor_data())
 
-# Clean up database connection when Flask is shutting down
-@app.teardown_appcontext
-def close_db_connection(exception):
+@app.route('/fleet')
+def fleet_overview():
+    """Head-office overview of every farm in the fleet registry"""
+    return render_template('fleet.html', overview=fleet.get_overview())
+
+@app.route('/api/fleet/overview')
+def api_fleet_overview():
+    """API endpoint for the latest readings and open alerts across all farms"""
+    return jsonify(fleet.get_overview())
+
+@app.route('/api/metrics/db-routing')
+def api_db_routing_metrics():
+    """API endpoint showing how database reads are routed across members"""
+    if db.client:
+        return jsonify(db.get_routing_metrics())
+    
+    return jsonify({'error': 'Database unavailable'}), 503
+
+@app.route('/admin/performance')
+def admin_performance():
+    """Admin page listing slow queries and captured request profiles"""
+    require_admin()
+    return render_template('admin_performance.html',
+                           slow_queries=db.get_slow_queries() if db.client else [],
+                           profiles=list_profiles(app.config['PROFILE_DIR']),
+                           token=request.args.get('token', ''))
+
+@app.route('/admin/profiles/<path:filename>')
+def admin_profile_file(filename):
+    """Download a captured request profile"""
+    require_admin()
+    return send_from_directory(app.config['PROFILE_DIR'], filename,
+                               mimetype='text/plain', as_attachment=True)
+
+# Clean up database connection when the worker process exits. Closing it after
+# every request would tear down the connection pool that background threads
+# and later requests rely on.
+@atexit.register
+def close_db_connection():
     if db.client:
         db.close_connection()
 
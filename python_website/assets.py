@@ -0,0 +1,78 @@
+"""
+Fingerprinted Static Asset Serving
+
+Loads the manifest written by build_assets.py so url_for('static') resolves to
+content-hashed filenames, and serves those files with far-future immutable
+cache headers and their pre-compressed brotli/gzip variants.
+"""
+import json
+import mimetypes
+import os
+
+from flask import request, send_from_directory
+
+# Fingerprinted files never change, so browsers may cache them for a year
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+# Preferred order when the client accepts several encodings
+PRECOMPRESSED_ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+
+def load_manifest(static_folder):
+    """Load the logical → fingerprinted filename mapping, if the build has run"""
+    manifest_path = os.path.join(static_folder, 'dist', 'manifest.json')
+    try:
+        with open(manifest_path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        print(f"⚠️ Could not read asset manifest: {e}")
+        return {}
+
+
+def init_assets(app):
+    """Wire fingerprinted asset URLs and serving into the Flask app"""
+    manifest = load_manifest(app.static_folder)
+    fingerprinted = set(manifest.values())
+
+    if manifest:
+        print(f"✅ Serving {len(manifest)} fingerprinted static assets")
+    else:
+        print("📝 No asset manifest found - run build_assets.py for self-hosted assets")
+
+    @app.url_defaults
+    def fingerprint_static_urls(endpoint, values):
+        if endpoint == 'static' and values.get('filename') in manifest:
+            values['filename'] = manifest[values['filename']]
+
+    @app.context_processor
+    def asset_helpers():
+        return {'asset_built': lambda filename: filename in manifest}
+
+    def send_static(filename):
+        if filename not in fingerprinted:
+            return app.send_static_file(filename)
+
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response = None
+        for encoding, suffix in PRECOMPRESSED_ENCODINGS:
+            if encoding in request.accept_encodings and \
+                    os.path.exists(os.path.join(app.static_folder, filename + suffix)):
+                response = send_from_directory(app.static_folder, filename + suffix,
+                                               mimetype=mimetype,
+                                               max_age=IMMUTABLE_MAX_AGE)
+                response.headers['Content-Encoding'] = encoding
+                break
+
+        if response is None:
+            response = send_from_directory(app.static_folder, filename,
+                                           mimetype=mimetype,
+                                           max_age=IMMUTABLE_MAX_AGE)
+
+        response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+    app.view_functions['static'] = send_static
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Static Asset Build Script for AquaTech Application
+
+Replaces the runtime CDN dependencies with self-hosted assets:
+1. Compiles a purged Tailwind stylesheet from the templates
+2. Vendors pinned versions of the JavaScript libraries
+3. Writes content-hashed copies of every asset to static/dist/
+4. Emits gzip (and brotli, when available) variants next to each copy
+5. Writes static/dist/manifest.json, used by assets.py to map url_for('static')
+   to the fingerprinted filenames
+
+Run it before starting the server (Render runs it as part of the build):
+    python build_assets.py
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import platform
+import shutil
+import stat
+import subprocess
+import sys
+import urllib.request
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip variants are always written
+    brotli = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(BASE_DIR, 'static')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+BUILD_DIR = os.path.join(BASE_DIR, '.build')
+MANIFEST_PATH = os.path.join(DIST_DIR, 'manifest.json')
+
+TAILWIND_VERSION = '3.4.17'
+TAILWIND_CONFIG = os.path.join(BASE_DIR, 'tailwind.config.js')
+TAILWIND_INPUT = os.path.join(STATIC_DIR, 'src', 'tailwind.css')
+TAILWIND_OUTPUT = os.path.join(STATIC_DIR, 'css', 'tailwind.css')
+
+# Pinned third-party scripts, keyed by their path under static/
+VENDOR_SCRIPTS = {
+    'vendor/lucide.min.js': 'https://cdn.jsdelivr.net/npm/lucide@0.460.0/dist/umd/lucide.min.js',
+    'vendor/chart.umd.min.js': 'https://cdn.jsdelivr.net/npm/chart.js@4.4.1/dist/chart.umd.js',
+}
+
+# Every asset that gets fingerprinted, as paths relative to static/
+FINGERPRINTED_ASSETS = [
+    'css/tailwind.css',
+    'css/style.css',
+] + list(VENDOR_SCRIPTS)
+
+# Compressing tiny files only adds requests for the variant lookup
+MIN_COMPRESS_SIZE = 256
+
+
+def tailwind_cli_path():
+    """Return the Tailwind standalone CLI, downloading it on first use"""
+    override = os.getenv('TAILWIND_CLI')
+    if override:
+        return override
+
+    system = platform.system().lower()
+    machine = platform.machine().lower()
+    arch = 'arm64' if machine in ('arm64', 'aarch64') else 'x64'
+
+    if system == 'windows':
+        binary = f'tailwindcss-windows-{arch}.exe'
+    elif system == 'darwin':
+        binary = f'tailwindcss-macos-{arch}'
+    else:
+        binary = f'tailwindcss-linux-{arch}'
+
+    path = os.path.join(BUILD_DIR, f'tailwindcss-{TAILWIND_VERSION}-{binary}')
+    if not os.path.exists(path):
+        url = (f'https://github.com/tailwindlabs/tailwindcss/releases/download/'
+               f'v{TAILWIND_VERSION}/{binary}')
+        print(f"⬇️ Downloading Tailwind CLI v{TAILWIND_VERSION}...")
+        download(url, path)
+        os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+
+    return path
+
+
+def download(url, destination):
+    """Download a URL to a local file"""
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    temp_path = destination + '.part'
+    with urllib.request.urlopen(url, timeout=60) as response, open(temp_path, 'wb') as f:
+        shutil.copyfileobj(response, f)
+    os.replace(temp_path, destination)
+
+
+def build_tailwind():
+    """Compile and purge the Tailwind stylesheet from the templates"""
+    print("🎨 Compiling Tailwind CSS...")
+    subprocess.run(
+        [tailwind_cli_path(),
+         '-c', TAILWIND_CONFIG,
+         '-i', TAILWIND_INPUT,
+         '-o', TAILWIND_OUTPUT,
+         '--minify'],
+        cwd=BASE_DIR,
+        check=True
+    )
+    print(f"✅ Wrote {os.path.relpath(TAILWIND_OUTPUT, BASE_DIR)} "
+          f"({os.path.getsize(TAILWIND_OUTPUT) // 1024} KB)")
+
+
+def vendor_scripts():
+    """Copy pinned JavaScript libraries into static/vendor/
+
+    Downloads are cached in .build/ under a key derived from the URL, so
+    changing a pin fetches the new version instead of reusing the old file.
+    """
+    for name, url in VENDOR_SCRIPTS.items():
+        url_key = hashlib.sha256(url.encode('utf-8')).hexdigest()[:12]
+        cached = os.path.join(BUILD_DIR, 'vendor', f'{url_key}-{os.path.basename(name)}')
+        if os.path.exists(cached):
+            print(f"✅ {name} cached")
+        else:
+            print(f"⬇️ Vendoring {name}...")
+            download(url, cached)
+
+        destination = os.path.join(STATIC_DIR, name)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        shutil.copyfile(cached, destination)
+
+
+def fingerprint_assets():
+    """Write content-hashed, pre-compressed copies and the manifest"""
+    print("🔖 Fingerprinting assets...")
+    if os.path.isdir(DIST_DIR):
+        shutil.rmtree(DIST_DIR)
+
+    manifest = {}
+    for name in FINGERPRINTED_ASSETS:
+        with open(os.path.join(STATIC_DIR, name), 'rb') as f:
+            content = f.read()
+
+        digest = hashlib.sha256(content).hexdigest()[:12]
+        directory, filename = os.path.split(name)
+        stem, ext = os.path.splitext(filename)
+        hashed_name = '/'.join(filter(None, ['dist', directory, f'{stem}.{digest}{ext}']))
+        hashed_path = os.path.join(STATIC_DIR, hashed_name)
+
+        os.makedirs(os.path.dirname(hashed_path), exist_ok=True)
+        with open(hashed_path, 'wb') as f:
+            f.write(content)
+
+        if len(content) >= MIN_COMPRESS_SIZE:
+            with open(hashed_path + '.gz', 'wb') as f:
+                f.write(gzip.compress(content, compresslevel=9, mtime=0))
+            if brotli is not None:
+                with open(hashed_path + '.br', 'wb') as f:
+                    f.write(brotli.compress(content, quality=11))
+
+        manifest[name] = hashed_name
+        print(f"   {name} → {hashed_name}")
+
+    with open(MANIFEST_PATH, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    if brotli is None:
+        print("⚠️ brotli is not installed - only gzip variants were written")
+    print(f"✅ Wrote manifest with {len(manifest)} assets")
+
+
+def main():
+    """Run the full asset build"""
+    print("🚀 AquaTech Asset Build")
+    print("=" * 30)
+
+    try:
+        build_tailwind()
+        vendor_scripts()
+        fingerprint_assets()
+    except Exception as e:
+        print(f"\n❌ Asset build failed: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Background-Materialized Dashboard Snapshot
+
+Every viewer of /dashboard sees the same content, so the view model is built
+once by a background thread instead of on every request. Across worker
+processes, whichever worker holds a short lease in MongoDB rebuilds the view
+every few seconds and stores it in a single document. The other workers load
+that document, and requests are served from the in-memory copy. Ingest can
+also wake the refresher so new readings show up without waiting for the
+interval.
+"""
+import os
+import socket
+import threading
+from datetime import datetime, timedelta
+
+from pymongo.errors import DuplicateKeyError
+
+SNAPSHOT_COLLECTION = 'dashboard_snapshots'
+SNAPSHOT_ID = 'dashboard'
+LEASE_ID = 'dashboard_lease'
+
+
+class DashboardSnapshot:
+    """Keeps a precomputed dashboard view model fresh in memory"""
+
+    def __init__(self, db, build, interval_seconds=5, lease_seconds=None):
+        """
+        `build()` must return the dashboard view model as a BSON-serializable
+        dict. The lease defaults to three refresh intervals, so its holder
+        renews it well before it expires.
+        """
+        if lease_seconds is None:
+            lease_seconds = 3 * interval_seconds
+        if lease_seconds <= interval_seconds:
+            raise ValueError("lease_seconds must be longer than interval_seconds, "
+                             "or the lease expires between renewals")
+        self.db = db
+        self.build = build
+        self.interval_seconds = interval_seconds
+        self.lease_seconds = lease_seconds
+
+        self._view = None
+        self._generated_at = None
+        self._lock = threading.Lock()
+        self._changed = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._owner = f"{socket.gethostname()}:{os.getpid()}"
+
+    @property
+    def _collection(self):
+        return self.db.db[SNAPSHOT_COLLECTION] if self.db.client else None
+
+    def get(self):
+        """Get the current view model, building it on first use"""
+        self._ensure_started()
+        if self._view is None:
+            with self._lock:
+                if self._view is None:
+                    # A shared snapshot older than the lease was left by a
+                    # worker that is no longer refreshing it
+                    max_age = timedelta(seconds=self.lease_seconds)
+                    try:
+                        loaded = self._load_shared()
+                    except Exception as e:
+                        print(f"⚠️ Could not load shared dashboard snapshot: {e}")
+                        loaded = False
+                    if not loaded or datetime.now() - self._generated_at > max_age:
+                        self._rebuild()
+        return self._view
+
+    def notify_change(self):
+        """Wake the refresher, e.g. after new sensor data was ingested"""
+        self._changed.set()
+
+    def _ensure_started(self):
+        # Threads do not survive a fork, so start one per worker process
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid != os.getpid() or self._thread is None or not self._thread.is_alive():
+                self._pid = os.getpid()
+                self._owner = f"{socket.gethostname()}:{self._pid}"
+                self._thread = threading.Thread(target=self._run, name='dashboard-snapshot',
+                                                daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            changed = self._changed.wait(self.interval_seconds)
+            self._changed.clear()
+            try:
+                if changed or self._acquire_lease():
+                    self._rebuild()
+                else:
+                    self._load_shared()
+            except Exception as e:
+                print(f"⚠️ Dashboard snapshot refresh failed: {e}")
+
+    def _rebuild(self):
+        """Build the view model and share it with the other workers"""
+        view = self.build()
+        generated_at = datetime.now()
+        self._view, self._generated_at = view, generated_at
+
+        collection = self._collection
+        if collection is not None:
+            try:
+                collection.replace_one(
+                    {'_id': SNAPSHOT_ID},
+                    {'view': view, 'generated_at': generated_at, 'owner': self._owner},
+                    upsert=True
+                )
+            except Exception as e:
+                print(f"⚠️ Could not share dashboard snapshot: {e}")
+
+    def _load_shared(self):
+        """Adopt the snapshot another worker stored, if it is newer than ours"""
+        collection = self._collection
+        if collection is None:
+            return False
+
+        document = collection.find_one({'_id': SNAPSHOT_ID})
+        if document is None:
+            return False
+        if self._generated_at is None or document['generated_at'] > self._generated_at:
+            self._view, self._generated_at = document['view'], document['generated_at']
+        return True
+
+    def _acquire_lease(self):
+        """Take or renew the rebuild lease; only its holder rebuilds on a timer"""
+        collection = self._collection
+        if collection is None:
+            # Without a database every worker builds its own snapshot
+            return True
+
+        now = datetime.now()
+        try:
+            collection.find_one_and_update(
+                {'_id': LEASE_ID,
+                 '$or': [{'expires_at': {'$lt': now}}, {'owner': self._owner}]},
+                {'$set': {'owner': self._owner,
+                          'expires_at': now + timedelta(seconds=self.lease_seconds)}},
+                upsert=True
+            )
+            return True
+        except DuplicateKeyError:
+            # Another worker holds an unexpired lease
+            return False
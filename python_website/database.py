@@ -1,20 +1,101 @@
 """
 MongoDB Database Configuration and Connection
 """
+from bson import ObjectId
 from pymongo import MongoClient
+from pymongo.read_preferences import (Nearest, Primary, PrimaryPreferred,
+                                      Secondary, SecondaryPreferred)
 from datetime import datetime, timedelta
 import random
 import os
+import time
+from feed_analytics import clear_cached_days
+from history_cache import SlidingWindowCache
+from sensor_schema import (FIELD_KEYS, SCHEMA_META_COLLECTION, SCHEMA_VERSION, SENSOR_SCHEMA_ID,
+                           STATE_V1, STATE_V2, V2_COLLECTION,
+                           SensorRegistry, create_v2_indexes, decode_document,
+                           append_reading, from_epoch, read_schema_state, to_epoch,
+                           write_readings)
+from routing_metrics import RoutingMetrics
+from slow_query_log import SlowQueryLog
+
+# Read preference modes available for display queries
+DISPLAY_READ_PREFERENCES = {
+    'primary': Primary,
+    'primaryPreferred': PrimaryPreferred,
+    'secondary': Secondary,
+    'secondaryPreferred': SecondaryPreferred,
+    'nearest': Nearest,
+}
+
+# How often workers re-read the sensor schema state, so they notice when a
+# migration switches storage to version 2
+SCHEMA_META_REFRESH_SECONDS = 30
+
+# MongoDB rejects maxStalenessSeconds values below 90
+MIN_MAX_STALENESS_SECONDS = 90
+
+def build_display_read_preference(mode, max_staleness_seconds):
+    """Build the read preference used for display-only queries"""
+    if mode not in DISPLAY_READ_PREFERENCES:
+        print(f"⚠️ Unknown read preference '{mode}', using primary")
+        mode = 'primary'
+    
+    if mode == 'primary':
+        return Primary()
+    
+    if max_staleness_seconds != -1 and max_staleness_seconds < MIN_MAX_STALENESS_SECONDS:
+        print(f"⚠️ maxStalenessSeconds must be at least {MIN_MAX_STALENESS_SECONDS}, "
+              f"using {MIN_MAX_STALENESS_SECONDS}")
+        max_staleness_seconds = MIN_MAX_STALENESS_SECONDS
+    
+    return DISPLAY_READ_PREFERENCES[mode](max_staleness=max_staleness_seconds)
+
+def count_present(expression):
+    """Aggregation expression that is 1 when a value is present and 0 when it is null or missing"""
+    return {"$cond": [{"$eq": [{"$ifNull": [expression, None]}, None]}, 0, 1]}
 
 class AquaTechDB:
     def __init__(self):
         # MongoDB connection string - using local MongoDB instance
         # For production, you would use a cloud service like MongoDB Atlas
         self.connection_string = os.getenv('MONGODB_URI', 'mongodb://localhost:27017/')
-        self.database_name = 'aquatech_db'
+        self.database_name = os.getenv('MONGODB_DATABASE', 'aquatech_db')
+        
+        # Display queries may be served by secondaries within a staleness
+        # bound; writes and read-your-own-write paths always use the primary
+        self.display_read_preference = build_display_read_preference(
+            os.getenv('MONGODB_DISPLAY_READ_PREFERENCE', 'secondaryPreferred'),
+            int(os.getenv('MONGODB_MAX_STALENESS_SECONDS', str(MIN_MAX_STALENESS_SECONDS)))
+        )
+        self.routing_metrics = RoutingMetrics()
+        
+        # Callbacks run after new sensor data is written
+        self.change_listeners = []
+        
+        # Queries slower than SLOW_QUERY_MS are explained and logged (0 disables)
+        self.slow_query_log = None
+        event_listeners = [self.routing_metrics]
+        slow_query_ms = float(os.getenv('SLOW_QUERY_MS', '200'))
+        if slow_query_ms > 0:
+            self.slow_query_log = SlowQueryLog(
+                threshold_ms=slow_query_ms,
+                explain_interval_seconds=float(os.getenv('SLOW_QUERY_EXPLAIN_INTERVAL_SECONDS', '300'))
+            )
+            event_listeners.append(self.slow_query_log)
+        
+        # Per-worker sliding-window cache for historical sensor queries
+        self.history_cache = None
+        if os.getenv('HISTORY_CACHE_ENABLED', 'true').lower() == 'true':
+            self.history_cache = SlidingWindowCache(
+                self._fetch_sensor_readings_since,
+                max_points=int(os.getenv('HISTORY_CACHE_MAX_POINTS', '100000')),
+                lookback_seconds=float(os.getenv('HISTORY_CACHE_LOOKBACK_SECONDS', '300'))
+            )
         
         try:
-            self.client = MongoClient(self.connection_string)
+            self.client = MongoClient(self.connection_string,
+                                      event_listeners=event_listeners)
             self.db = self.client[self.database_name]
             
             # Test the connection
@@ -26,10 +107,28 @@ class AquaTechDB:
             self.feeding_schedules = self.db.feeding_schedules
             self.alerts = self.db.alerts
             self.system_settings = self.db.system_settings
+            self.sensor_readings = self.db[V2_COLLECTION]
+            self.sensor_registry = SensorRegistry(self.db)
+            
+            # Display-only views of the collections that dashboards read
+            self.display_sensor_data = self.sensor_data.with_options(
+                read_preference=self.display_read_preference)
+            self.display_sensor_readings = self.sensor_readings.with_options(
+                read_preference=self.display_read_preference)
+            self.display_alerts = self.alerts.with_options(
+                read_preference=self.display_read_preference)
+            self.display_feeding_schedules = self.feeding_schedules.with_options(
+                read_preference=self.display_read_preference)
+            
+            # Which storage schema sensor readings use
+            self.load_sensor_schema()
             
             # Create indexes for better performance
             self.create_indexes()
             
+            if self.slow_query_log is not None:
+                self.slow_query_log.attach(self.client, self.db)
+            
             # Initialize with sample data if empty
             self.initialize_sample_data()
             
@@ -45,12 +144,26 @@ class AquaTechDB:
             # Index on timestamp for sensor data (for time-based queries)
             self.sensor_data.create_index([("timestamp", -1)])
             
+            # Per-sensor time range queries for the history cache
+            self.sensor_data.create_index([("sensor_id", 1), ("timestamp", 1)])
+            
             # Index on feeding schedule times
             self.feeding_schedules.create_index([("time", 1), ("date", 1)])
             
+            # Completed feedings by time for the feed conversion analytics
+            self.feeding_schedules.create_index([("status", 1), ("completed_at", 1)])
+            
             # Index on alert timestamps
             self.alerts.create_index([("timestamp", -1)])
             
+            # Open alerts for the fleet overview
+            self.alerts.create_index([("acknowledged", 1), ("timestamp", -1)])
+            
+            # Compact version 2 sensor storage
+            if self.sensor_schema['state'] != STATE_V1:
+                self.sensor_registry.create_indexes()
+                create_v2_indexes(self.sensor_readings, self.sensor_schema['pack_seconds'])
+            
             print("✅ Database indexes created successfully")
         except Exception as e:
             print(f"⚠️ Index creation failed: {e}")
@@ -59,7 +172,7 @@ class AquaTechDB:
         """Initialize the database with sample data if it's empty"""
         try:
             # Check if we already have data
-            if self.sensor_data.count_documents({}) == 0:
+            if self._sensor_collection().count_documents({}) == 0:
                 print("📊 Initializing database with sample sensor data...")
                 self.seed_sensor_data()
             
@@ -101,16 +214,25 @@ class AquaTechDB:
                 sensor_readings.append(reading)
         
         # Insert all readings at once for better performance
-        self.sensor_data.insert_many(sensor_readings)
+        if self._uses_v2():
+            write_readings(self.sensor_readings, self.sensor_registry, sensor_readings,
+                           self.sensor_schema['pack_seconds'])
+        else:
+            self.sensor_data.insert_many(sensor_readings)
         print(f"✅ Inserted {len(sensor_readings)} sensor readings")
+        
+        # Feed analytics cached before the seed would hide these readings
+        clear_cached_days(self.db, min(reading['timestamp'] for reading in sensor_readings))
     
     def seed_feeding_data(self):
         """Create feeding schedules for today"""
         today = datetime.now().date()
+        # BSON has no date-only type, so the day is stored as midnight
+        day = datetime.combine(today, datetime.min.time())
         
         feeding_schedule = [
             {
-                "date": today,
+                "date": day,
                 "time": "06:00",
                 "amount_kg": 2.5,
                 "status": "completed",
@@ -118,7 +240,7 @@ class AquaTechDB:
                 "tank": "Tank A"
             },
             {
-                "date": today,
+                "date": day,
                 "time": "10:00", 
                 "amount_kg": 3.0,
                 "status": "completed",
@@ -126,21 +248,21 @@ class AquaTechDB:
                 "tank": "Tank A"
             },
             {
-                "date": today,
+                "date": day,
                 "time": "14:00",
                 "amount_kg": 2.8,
                 "status": "pending",
                 "tank": "Tank A"
             },
             {
-                "date": today,
+                "date": day,
                 "time": "18:00",
                 "amount_kg": 2.5,
                 "status": "scheduled",
                 "tank": "Tank A"
             },
             {
-                "date": today,
+                "date": day,
                 "time": "22:00",
                 "amount_kg": 1.8,
                 "status": "scheduled",
@@ -192,6 +314,8 @@ class AquaTechDB:
                     "capacity_liters": 10000,
                     "fish_species": "Atlantic Salmon",
                     "fish_count": 500,
+                    "average_weight_g": 850,
+                    "weighed_at": datetime.now() - timedelta(days=14),
                     "optimal_ph_range": [6.5, 8.5],
                     "optimal_temp_range": [18, 24],
                     "optimal_do_range": [6, 12]
@@ -223,9 +347,95 @@ class AquaTechDB:
         self.system_settings.insert_one(settings)
         print("✅ Created system settings")
     
+    def load_sensor_schema(self):
+        """Read the sensor storage schema, setting up version 2 for new databases"""
+        schema = read_schema_state(self.db)
+        
+        # New deployments can start directly on the compact schema
+        target_version = int(os.getenv('SENSOR_SCHEMA_VERSION', '1'))
+        if (schema['state'] == STATE_V1 and target_version == SCHEMA_VERSION
+                and self.sensor_data.estimated_document_count() == 0):
+            schema = {'_id': SENSOR_SCHEMA_ID, 'state': STATE_V2, 'version': SCHEMA_VERSION,
+                      'pack_seconds': int(os.getenv('SENSOR_PACK_SECONDS', '0')),
+                      'migrated': 0, 'completed_at': datetime.now()}
+            self.db[SCHEMA_META_COLLECTION].replace_one({'_id': SENSOR_SCHEMA_ID}, schema,
+                                                        upsert=True)
+            print("✅ Using compact sensor schema version 2")
+        
+        self.sensor_schema = schema
+        self._sensor_schema_checked_at = time.monotonic()
+    
+    def _uses_v2(self, refresh=True):
+        """
+        Whether readings are read from and written to the version 2 collection.
+        With `refresh=False` the last known state is used, which history cache
+        fetches rely on so they never invalidate the cache they are filling.
+        """
+        if refresh and time.monotonic() - self._sensor_schema_checked_at > SCHEMA_META_REFRESH_SECONDS:
+            previous_state = self.sensor_schema['state']
+            try:
+                self.sensor_schema = read_schema_state(self.db)
+            except Exception as e:
+                print(f"⚠️ Could not refresh sensor schema state: {e}")
+            self._sensor_schema_checked_at = time.monotonic()
+            
+            # Cached windows hold readings decoded from the previous storage
+            if self.sensor_schema['state'] != previous_state and self.history_cache is not None:
+                self.history_cache.invalidate()
+        
+        return self.sensor_schema['state'] == STATE_V2
+    
+    def _sensor_collection(self):
+        """The collection currently holding authoritative sensor readings"""
+        return self.sensor_readings if self._uses_v2() else self.sensor_data
+    
+    def _v2_time_key(self):
+        # Packed buckets are ordered by their newest reading
+        return 'te' if self.sensor_schema['pack_seconds'] else 't'
+    
+    def _route(self, route, operation):
+        """Record a routing decision for the metrics endpoint"""
+        self.routing_metrics.record_decision(route, operation)
+    
+    def get_routing_metrics(self):
+        """Get routing decisions and per-member command counts"""
+        metrics = self.routing_metrics.snapshot(self.client)
+        metrics['display_read_preference'] = self.display_read_preference.document
+        return metrics
+    
+    def on_sensor_data_change(self, callback):
+        """Register a callback to run after new sensor data is written"""
+        self.change_listeners.append(callback)
+    
+    def _notify_sensor_data_change(self):
+        for callback in self.change_listeners:
+            try:
+                callback()
+            except Exception as e:
+                print(f"⚠️ Sensor data change callback failed: {e}")
+    
+    def get_slow_queries(self, limit=50):
+        """Get the most recently logged slow queries"""
+        try:
+            if self.slow_query_log is None:
+                return []
+            return self.slow_query_log.get_recent(limit)
+        except Exception as e:
+            print(f"❌ Error fetching slow queries: {e}")
+            return []
+    
     def get_latest_sensor_data(self):
         """Get the most recent sensor reading"""
         try:
+            # Newly ingested readings must be visible immediately
+            self._route('primary', 'get_latest_sensor_data')
+            if self._uses_v2():
+                document = self.sensor_readings.find_one(
+                    sort=[(self._v2_time_key(), -1)]
+                )
+                # Decoded readings are oldest first; a packed bucket holds several
+                return decode_document(document, self.sensor_registry)[-1] if document else None
+            
             latest = self.sensor_data.find_one(
                 sort=[("timestamp", -1)]
             )
@@ -238,31 +448,180 @@ class AquaTechDB:
             print(f"❌ Error fetching latest sensor data: {e}")
             return None
     
-    def get_historical_sensor_data(self, hours=24):
+    def get_historical_sensor_data(self, hours=24, sensor_id=None):
         """Get sensor data for the specified number of hours"""
         try:
-            start_time = datetime.now() - timedelta(hours=hours)
-            
-            cursor = self.sensor_data.find(
-                {"timestamp": {"$gte": start_time}},
-                sort=[("timestamp", 1)]
-            )
-            
-            data = []
-            for record in cursor:
-                record['_id'] = str(record['_id'])
-                data.append(record)
+            # Resolve the storage schema before entering the cache, so a
+            # schema switch invalidates it here rather than inside a fetch
+            self._uses_v2()
+            if self.history_cache is not None:
+                return self.history_cache.get(hours, sensor_id)
             
-            return data
+            start_time = datetime.now() - timedelta(hours=hours)
+            return self._fetch_sensor_readings_since(start_time, sensor_id)
         except Exception as e:
             print(f"❌ Error fetching historical data: {e}")
             return []
     
+    def _fetch_sensor_readings_since(self, start_time, sensor_id=None):
+        """Fetch readings with timestamp >= start_time, oldest first"""
+        if self._uses_v2(refresh=False):
+            return self._fetch_v2_readings_since(start_time, sensor_id)
+        
+        query = {"timestamp": {"$gte": start_time}}
+        if sensor_id is not None:
+            query["sensor_id"] = sensor_id
+        
+        self._route('display', 'get_historical_sensor_data')
+        cursor = self.display_sensor_data.find(query, sort=[("timestamp", 1)])
+        
+        data = []
+        for record in cursor:
+            record['_id'] = str(record['_id'])
+            data.append(record)
+        
+        return data
+    
+    def _fetch_v2_readings_since(self, start_time, sensor_id=None):
+        """Fetch and decode version 2 readings with timestamp >= start_time"""
+        time_key = self._v2_time_key()
+        query = {time_key: {"$gte": to_epoch(start_time)}}
+        if sensor_id is not None:
+            sensor_refs = self.sensor_registry.find_refs(sensor_id)
+            if not sensor_refs:
+                return []
+            query["s"] = {"$in": sensor_refs}
+        
+        self._route('display', 'get_historical_sensor_data')
+        cursor = self.display_sensor_readings.find(query, sort=[(time_key, 1)])
+        
+        data = []
+        for document in cursor:
+            for reading in decode_document(document, self.sensor_registry):
+                if reading['timestamp'] >= start_time:
+                    data.append(reading)
+        
+        # Buckets of different sensors overlap in time
+        if self.sensor_schema['pack_seconds']:
+            data.sort(key=lambda reading: reading['timestamp'])
+        return data
+    
+    def aggregate_daily_feed(self, start, end):
+        """
+        Total completed feed per tank and day, for start <= completed_at < end.
+        Unlike the display queries this raises on errors, so a failed query is
+        never mistaken for days without feedings.
+        """
+        self._route('display', 'aggregate_daily_feed')
+        cursor = self.display_feeding_schedules.aggregate([
+            {"$match": {"status": "completed", "completed_at": {"$gte": start, "$lt": end}}},
+            # Timestamps are stored as naive local times, so formatting them
+            # without a timezone gives the local day
+            {"$group": {
+                "_id": {"tank": "$tank",
+                        "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$completed_at"}}},
+                "feed_kg": {"$sum": "$amount_kg"},
+                "feedings": {"$sum": 1}
+            }}
+        ])
+        
+        rows = []
+        for row in cursor:
+            row.update(row.pop('_id'))
+            rows.append(row)
+        return rows
+    
+    def aggregate_daily_sensor_sums(self, start, end, fields=('temperature', 'dissolved_oxygen')):
+        """
+        Sum and count of each sensor field per tank and day, for
+        start <= timestamp < end. Raises on errors like aggregate_daily_feed.
+        """
+        if self._uses_v2():
+            return self._aggregate_v2_daily_sensor_sums(start, end, fields)
+        
+        group = {"_id": {"location": "$location",
+                         "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$timestamp"}}}}
+        for field in fields:
+            group[f"{field}_sum"] = {"$sum": f"${field}"}
+            group[f"{field}_n"] = {"$sum": count_present(f"${field}")}
+        
+        self._route('display', 'aggregate_daily_sensor_sums')
+        cursor = self.display_sensor_data.aggregate([
+            {"$match": {"timestamp": {"$gte": start, "$lt": end}}},
+            {"$group": group}
+        ])
+        
+        rows = []
+        for row in cursor:
+            row.update(row.pop('_id'))
+            rows.append(row)
+        return rows
+    
+    def _aggregate_v2_daily_sensor_sums(self, start, end, fields):
+        """Version 2 daily sums, grouped by UTC hour on the server and folded into local days"""
+        pack_seconds = self.sensor_schema['pack_seconds']
+        start_epoch, end_epoch = to_epoch(start), to_epoch(end)
+        keys = {field: FIELD_KEYS[field] for field in fields}
+        group = {"_id": {"s": "$s", "hour": {"$subtract": ["$t", {"$mod": ["$t", 3600]}]}}}
+        
+        # Packed buckets are indexed by their newest reading, which is less
+        # than pack_seconds after the bucket start, so te bounds both sides
+        bucket_match = {"te": {"$gte": start_epoch, "$lt": end_epoch + pack_seconds}}
+        
+        if pack_seconds and 3600 % pack_seconds == 0:
+            # Every bucket lies within one hour, so whole arrays are summed
+            # without unwinding the individual readings
+            pipeline = [{"$match": dict(bucket_match, t={"$gte": start_epoch, "$lt": end_epoch})}]
+            for field, key in keys.items():
+                group[f"{field}_sum"] = {"$sum": {"$sum": f"${key}"}}
+                group[f"{field}_n"] = {"$sum": {"$size": {"$filter": {
+                    "input": f"${key}", "cond": {"$ne": ["$$this", None]}}}}}
+        else:
+            pipeline = [{"$match": {"t": {"$gte": start_epoch, "$lt": end_epoch}}}]
+            if pack_seconds:
+                # Longer buckets can span several hours, so they are unwound
+                # into readings first
+                project = {"s": 1, "t": {"$add": ["$t", "$dt"]}}
+                for key in keys.values():
+                    project[key] = {"$arrayElemAt": [f"${key}", "$i"]}
+                pipeline = [
+                    {"$match": dict(bucket_match, t={"$lt": end_epoch})},
+                    {"$unwind": {"path": "$dt", "includeArrayIndex": "i"}},
+                    {"$project": project},
+                    {"$match": {"t": {"$gte": start_epoch, "$lt": end_epoch}}}
+                ]
+            for field, key in keys.items():
+                group[f"{field}_sum"] = {"$sum": f"${key}"}
+                group[f"{field}_n"] = {"$sum": count_present(f"${key}")}
+        pipeline.append({"$group": group})
+        
+        self._route('display', 'aggregate_daily_sensor_sums')
+        days = {}
+        totals = {}
+        for row in self.display_sensor_readings.aggregate(pipeline):
+            hour = row['_id']['hour']
+            if hour not in days:
+                days[hour] = from_epoch(hour).strftime('%Y-%m-%d')
+            location = self.sensor_registry.describe(row['_id']['s'])[1]
+            
+            total = totals.get((location, days[hour]))
+            if total is None:
+                total = totals[(location, days[hour])] = {'location': location, 'day': days[hour]}
+                for field in fields:
+                    total[f"{field}_sum"] = total[f"{field}_n"] = 0
+            for field in fields:
+                total[f"{field}_sum"] += row[f"{field}_sum"]
+                total[f"{field}_n"] += row[f"{field}_n"]
+        
+        return list(totals.values())
+    
     def get_todays_feeding_schedule(self):
         """Get feeding schedule for today"""
         try:
-            today = datetime.now().date()
+            today = datetime.combine(datetime.now().date(), datetime.min.time())
             
+            # Feeding status changes must be visible right after they are written
+            self._route('primary', 'get_todays_feeding_schedule')
             cursor = self.feeding_schedules.find(
                 {"date": today},
                 sort=[("time", 1)]
@@ -272,7 +631,7 @@ class AquaTechDB:
             for feeding in cursor:
                 feeding['_id'] = str(feeding['_id'])
                 # Convert date to string for JSON serialization
-                feeding['date'] = feeding['date'].isoformat()
+                feeding['date'] = feeding['date'].date().isoformat()
                 schedule.append(feeding)
             
             return schedule
@@ -283,7 +642,8 @@ class AquaTechDB:
     def get_recent_alerts(self, limit=10):
         """Get recent system alerts"""
         try:
-            cursor = self.alerts.find(
+            self._route('display', 'get_recent_alerts')
+            cursor = self.display_alerts.find(
                 sort=[("timestamp", -1)],
                 limit=limit
             )
@@ -302,7 +662,27 @@ class AquaTechDB:
         """Insert a new sensor reading"""
         try:
             sensor_data['timestamp'] = datetime.now()
+            self._route('primary', 'insert_sensor_reading')
+            
+            if self._uses_v2():
+                pack_seconds = self.sensor_schema['pack_seconds']
+                if pack_seconds:
+                    # Live readings are always appended, even when the sensor
+                    # already reported within the same second
+                    sensor_ref = self.sensor_registry.ref_for(sensor_data.get('sensor_id'),
+                                                              sensor_data.get('location'))
+                    reading_id = append_reading(self.sensor_readings, sensor_ref, sensor_data,
+                                                pack_seconds)
+                else:
+                    sensor_data['_id'] = ObjectId()
+                    write_readings(self.sensor_readings, self.sensor_registry, [sensor_data],
+                                   pack_seconds)
+                    reading_id = str(sensor_data['_id'])
+                self._notify_sensor_data_change()
+                return reading_id
+            
             result = self.sensor_data.insert_one(sensor_data)
+            self._notify_sensor_data_change()
             return str(result.inserted_id)
         except Exception as e:
             print(f"❌ Error inserting sensor data: {e}")
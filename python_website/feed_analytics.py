@@ -0,0 +1,431 @@
+"""
+Feed Conversion Analytics
+
+Joins completed feedings with sensor history. For each tank it reports the
+daily feed, the estimated feed conversion ratio (FCR), and how the amount fed
+responds to water temperature and dissolved oxygen.
+
+MongoDB reduces the raw history to one row per tank and day. Those rows are
+cached in `feed_analytics_daily`, one document per day. A closed day is
+aggregated once. Requests only aggregate the days that are still receiving
+data, and days they cached before those closed. Closed days that are not
+cached yet are left to a background backfill, which aggregates them in chunks
+of a few days and caches each chunk before the next one starts, so a cold
+cache over months of history never holds a worker past its timeout. A lease
+in MongoDB lets only one worker process run the backfill at a time. Growth,
+FCR and the response curves are computed from the daily rows with numpy.
+
+Fish are not weighed by the system, so the biomass gain behind the FCR is an
+estimate. It uses the thermal growth coefficient (TGC) model, starting from
+the average weight recorded in the tank's settings:
+    W_end^(1/3) = W_start^(1/3) + TGC / 1000 × daily mean temperature
+Mortality and harvests are not modelled, so the fish count is constant.
+"""
+import os
+import socket
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+from pymongo import ReplaceOne
+from pymongo.errors import DuplicateKeyError
+
+ANALYTICS_COLLECTION = 'feed_analytics_daily'
+BACKFILL_LEASE_ID = 'backfill_lease'
+
+# Typical thermal growth coefficients, used when a tank does not set `tgc`
+SPECIES_TGC = {
+    'Atlantic Salmon': 2.8,
+    'Rainbow Trout': 2.4,
+    'Nile Tilapia': 1.6,
+}
+DEFAULT_TGC = 2.5
+
+# Longest history a report, including its growth model, can cover
+MAX_DAYS = 730
+
+# Days aggregated per query and cached together while filling the cache
+BACKFILL_CHUNK_DAYS = 14
+
+# The backfill renews its lease before each chunk, so this must comfortably
+# exceed the time one chunk takes
+BACKFILL_LEASE_SECONDS = 300
+
+# Bin widths of the response curves, in °C and mg/L
+TEMPERATURE_BIN = 1.0
+DISSOLVED_OXYGEN_BIN = 0.5
+
+
+class AnalyticsPending(Exception):
+    """Raised while missing days are still being aggregated in the background"""
+
+
+class FeedAnalytics:
+    """Per-tank feed conversion reports backed by a per-day cache"""
+
+    def __init__(self, db, refresh_seconds=300, settle_seconds=3600):
+        """
+        Days that may still receive data are aggregated again at most every
+        `refresh_seconds`. A day is closed once it has been aggregated
+        `settle_seconds` after it ended.
+        """
+        self.db = db
+        self.refresh_seconds = refresh_seconds
+        self.settle_seconds = settle_seconds
+        self._lock = threading.Lock()
+        self._backfill = None
+
+    @property
+    def _collection(self):
+        return self.db.db[ANALYTICS_COLLECTION]
+
+    def get_report(self, days=90, tank=None):
+        """Daily feed, FCR and response curves per tank for the last `days` days"""
+        days = max(1, min(int(days), MAX_DAYS))
+        today = datetime.combine(datetime.now().date(), datetime.min.time())
+        first_day = today - timedelta(days=days - 1)
+
+        # Growth is modelled from each tank's last weighing, which may lie
+        # before the reported period
+        tank_settings = self._tank_settings()
+        model_start = first_day
+        for settings in tank_settings.values():
+            if settings.get('weighed_at'):
+                model_start = min(model_start, _day_of(settings['weighed_at']))
+        model_start = max(model_start, today - timedelta(days=MAX_DAYS - 1))
+
+        daily = self._load_days(model_start, today)
+        names = sorted({row['tank'] for day in daily for row in day['tanks']})
+        if tank is not None:
+            names = [name for name in names if name == tank]
+
+        offset = (first_day - model_start).days
+        return {
+            'start': first_day.strftime('%Y-%m-%d'),
+            'end': today.strftime('%Y-%m-%d'),
+            'days': days,
+            'tanks': [self._tank_report(name, daily, _settings_for(tank_settings, name), offset)
+                      for name in names],
+            'generated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        }
+
+    def _tank_settings(self):
+        settings = self.db.system_settings.find_one({}, {'tank_settings': 1}) or {}
+        return settings.get('tank_settings', {})
+
+    def _load_days(self, first_day, last_day):
+        """Get the daily rows from first_day to last_day, aggregating stale days"""
+        all_days = [first_day + timedelta(days=i) for i in range((last_day - first_day).days + 1)]
+        cached = self._read_cache(first_day)
+        if all(self._is_current(cached.get(day), day) for day in all_days):
+            return [cached[day] for day in all_days]
+
+        # Only one request aggregates; concurrent requests wait and reuse it
+        with self._lock:
+            cached = self._read_cache(first_day)
+            stale = [day for day in all_days if not self._is_current(cached.get(day), day)]
+            # The request only refreshes today and recently cached days, which
+            # are few; closed days missing from the cache can be months of history
+            recent = [day for day in stale if not self._needs_backfill(cached.get(day), day)]
+            for start, end in _contiguous_ranges(recent):
+                for document in self._compute_days(start, end):
+                    cached[document['day']] = document
+
+            if len(recent) < len(stale):
+                self._start_backfill(first_day, all_days)
+                raise AnalyticsPending("Feed history is still being aggregated")
+        return [cached[day] for day in all_days]
+
+    def _needs_backfill(self, document, day):
+        """Whether a day is closed but not cached, and so left to the backfill"""
+        closes_at = day + timedelta(days=1, seconds=self.settle_seconds)
+        return document is None and datetime.now() >= closes_at
+
+    def _start_backfill(self, first_day, all_days):
+        """Aggregate the missing closed days on a background thread; the caller holds the lock"""
+        if self._backfill is not None and self._backfill.is_alive():
+            return
+        # Another worker process is already backfilling
+        if not self._acquire_lease():
+            return
+
+        def run():
+            try:
+                cached = self._read_cache(first_day)
+                missing = [day for day in all_days if self._needs_backfill(cached.get(day), day)]
+                # Newest first, so recent days are reported soonest
+                for day_range in reversed(_contiguous_ranges(missing)):
+                    for start, end in reversed(_chunked(*day_range, BACKFILL_CHUNK_DAYS)):
+                        if not self._acquire_lease():
+                            return
+                        self._compute_days(start, end)
+            except Exception as e:
+                print(f"⚠️ Feed analytics backfill failed: {e}")
+            finally:
+                self._release_lease()
+
+        self._backfill = threading.Thread(target=run, name='feed-analytics-backfill', daemon=True)
+        self._backfill.start()
+
+    @property
+    def _owner(self):
+        # Computed on use, since gunicorn forks workers after the app is loaded
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def _acquire_lease(self):
+        """Take or renew the backfill lease"""
+        now = datetime.now()
+        try:
+            self._collection.find_one_and_update(
+                {'_id': BACKFILL_LEASE_ID,
+                 '$or': [{'expires_at': {'$lt': now}}, {'owner': self._owner}]},
+                {'$set': {'owner': self._owner,
+                          'expires_at': now + timedelta(seconds=BACKFILL_LEASE_SECONDS)}},
+                upsert=True
+            )
+            return True
+        except DuplicateKeyError:
+            # Another worker holds an unexpired lease
+            return False
+
+    def _release_lease(self):
+        try:
+            self._collection.delete_one({'_id': BACKFILL_LEASE_ID, 'owner': self._owner})
+        except Exception as e:
+            print(f"⚠️ Could not release the feed analytics backfill lease: {e}")
+
+    def _read_cache(self, first_day):
+        return {document['day']: document
+                for document in self._collection.find({'day': {'$gte': first_day}})}
+
+    def _is_current(self, document, day):
+        if document is None:
+            return False
+        computed_at = document['computed_at']
+        if computed_at >= day + timedelta(days=1, seconds=self.settle_seconds):
+            return True
+        return (datetime.now() - computed_at).total_seconds() < self.refresh_seconds
+
+    def _compute_days(self, start, end):
+        """Aggregate the days start <= day < end and store them in the cache"""
+        tanks_by_day = {}
+
+        def tank_row(day, tank):
+            rows = tanks_by_day.setdefault(day, {})
+            if tank not in rows:
+                rows[tank] = {'tank': tank, 'feed_kg': 0.0, 'feedings': 0,
+                              'temperature': None, 'dissolved_oxygen': None}
+            return rows[tank]
+
+        for row in self.db.aggregate_daily_feed(start, end):
+            if row['tank'] is None:
+                continue
+            totals = tank_row(row['day'], row['tank'])
+            totals['feed_kg'] = round(row['feed_kg'], 3)
+            totals['feedings'] = row['feedings']
+
+        for row in self.db.aggregate_daily_sensor_sums(start, end):
+            # Readings without a tank cannot be matched to feedings
+            if row['location'] is None:
+                continue
+            totals = tank_row(row['day'], row['location'])
+            for field in ('temperature', 'dissolved_oxygen'):
+                if row[f"{field}_n"]:
+                    totals[field] = round(row[f"{field}_sum"] / row[f"{field}_n"], 3)
+
+        computed_at = datetime.now()
+        documents = []
+        day = start
+        while day < end:
+            key = day.strftime('%Y-%m-%d')
+            documents.append({'_id': key, 'day': day,
+                              'tanks': list(tanks_by_day.get(key, {}).values()),
+                              'computed_at': computed_at})
+            day += timedelta(days=1)
+
+        try:
+            self._collection.bulk_write(
+                [ReplaceOne({'_id': document['_id']}, document, upsert=True)
+                 for document in documents],
+                ordered=False)
+        except Exception as e:
+            print(f"⚠️ Could not cache feed analytics: {e}")
+        return documents
+
+    def _tank_report(self, name, daily, settings, offset):
+        """Build one tank's report; `offset` is the index of the first reported day"""
+        count = len(daily)
+        feed = np.zeros(count)
+        feedings = np.zeros(count, dtype=np.int64)
+        temperature = np.full(count, np.nan)
+        dissolved_oxygen = np.full(count, np.nan)
+        for index, day in enumerate(daily):
+            for row in day['tanks']:
+                if row['tank'] == name:
+                    feed[index] = row['feed_kg']
+                    feedings[index] = row['feedings']
+                    if row['temperature'] is not None:
+                        temperature[index] = row['temperature']
+                    if row['dissolved_oxygen'] is not None:
+                        dissolved_oxygen[index] = row['dissolved_oxygen']
+                    break
+
+        fish_count = settings.get('fish_count')
+        weights = estimate_weights(temperature, settings, daily[0]['day'])
+        gain = np.full(count, np.nan)
+        biomass = np.full(count, np.nan)
+        fcr = np.full(count, np.nan)
+        if weights is not None and fish_count:
+            biomass = fish_count * weights[:-1] / 1000
+            gain = fish_count * np.diff(weights) / 1000
+            with np.errstate(divide='ignore', invalid='ignore'):
+                fcr = np.where((feed > 0) & (gain > 0), feed / gain, np.nan)
+            # Today's feeding is not finished, so it has no FCR yet
+            fcr[-1] = np.nan
+
+        # Totals cover the completed days of the reported period that have
+        # feeding records, since days without any are missing data, not fasts
+        complete = slice(offset, count - 1)
+        fed = feed[complete] > 0
+        total_gain = np.nansum(gain[complete][fed])
+        total_feed = feed[complete][fed].sum()
+        period = slice(offset, count)
+        model = None
+        if weights is not None:
+            model = {
+                'tgc': _tgc_for(settings),
+                'average_weight_g': settings['average_weight_g'],
+                'weighed_at': (settings['weighed_at'].strftime('%Y-%m-%d')
+                               if settings.get('weighed_at') else None)
+            }
+
+        return {
+            'tank': name,
+            'species': settings.get('fish_species'),
+            'fish_count': fish_count,
+            'total_feed_kg': round(float(total_feed), 2),
+            'estimated_gain_kg': round(float(total_gain), 2) if total_gain > 0 else None,
+            'fcr': round(float(total_feed / total_gain), 2) if total_gain > 0 else None,
+            'growth_model': model,
+            'daily': {
+                'dates': [day['_id'] for day in daily[period]],
+                'feed_kg': _to_list(feed[period], 2),
+                'feedings': feedings[period].tolist(),
+                'temperature': _to_list(temperature[period], 2),
+                'dissolved_oxygen': _to_list(dissolved_oxygen[period], 2),
+                'average_weight_g': _to_list(weights[:-1][period], 1) if weights is not None else None,
+                'biomass_kg': _to_list(biomass[period], 1),
+                'fcr': _to_list(fcr[period], 2)
+            },
+            'response_curves': {
+                'temperature': response_curve(temperature[complete], feed[complete],
+                                              fcr[complete], TEMPERATURE_BIN),
+                'dissolved_oxygen': response_curve(dissolved_oxygen[complete], feed[complete],
+                                                   fcr[complete], DISSOLVED_OXYGEN_BIN)
+            }
+        }
+
+
+def clear_cached_days(database, first_day=None):
+    """
+    Drop the cached daily rows from `first_day` on, or all of them. Call it
+    after writing feedings or readings for past days, which would otherwise
+    keep being reported from the cache.
+    """
+    query = {'day': {'$gte': _day_of(first_day)}} if first_day else {'day': {'$exists': True}}
+    return database[ANALYTICS_COLLECTION].delete_many(query).deleted_count
+
+
+def estimate_weights(temperature, settings, first_day):
+    """
+    Estimate the average fish weight in grams at the start of each day, plus
+    the end of the last day, with the TGC model. Returns None when the tank
+    has no recorded weight or no temperature readings.
+    """
+    weight = settings.get('average_weight_g')
+    valid = ~np.isnan(temperature)
+    if not weight or not valid.any():
+        return None
+
+    # Days without readings use the temperature interpolated from their neighbours
+    days = np.arange(len(temperature))
+    filled = np.interp(days, days[valid], temperature[valid])
+    degree_days = np.concatenate([[0.0], np.cumsum(np.clip(filled, 0, None))])
+
+    # The weighing anchors the curve; days before it are modelled backwards
+    anchor = 0
+    if settings.get('weighed_at'):
+        anchor = int(np.clip((_day_of(settings['weighed_at']) - first_day).days, 0, len(temperature)))
+
+    cube_roots = np.cbrt(weight) + _tgc_for(settings) / 1000 * (degree_days - degree_days[anchor])
+    return np.clip(cube_roots, 0, None) ** 3
+
+
+def response_curve(values, feed, fcr, width):
+    """Mean daily feed and FCR on the fed days, binned by a water quality value"""
+    valid = ~np.isnan(values) & (feed > 0)
+    if not valid.any():
+        return {'bins': [], 'days': [], 'mean_feed_kg': [], 'mean_fcr': []}
+
+    bins = np.floor(values[valid] / width) * width
+    lower_edges, index, days = np.unique(bins, return_inverse=True, return_counts=True)
+    mean_feed = np.bincount(index, weights=feed[valid]) / days
+
+    fcr = fcr[valid]
+    has_fcr = ~np.isnan(fcr)
+    fcr_days = np.bincount(index[has_fcr], minlength=len(lower_edges))
+    fcr_sums = np.bincount(index[has_fcr], weights=fcr[has_fcr], minlength=len(lower_edges))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_fcr = np.where(fcr_days > 0, fcr_sums / fcr_days, np.nan)
+
+    return {
+        'bins': _to_list(lower_edges + width / 2, 2),
+        'days': days.tolist(),
+        'mean_feed_kg': _to_list(mean_feed, 2),
+        'mean_fcr': _to_list(mean_fcr, 2)
+    }
+
+
+def _tgc_for(settings):
+    return settings.get('tgc') or SPECIES_TGC.get(settings.get('fish_species'), DEFAULT_TGC)
+
+
+def _settings_for(tank_settings, tank):
+    """Find a tank's settings by key ("tank_a") or display name ("Tank A - Main Production")"""
+    key = tank.lower().replace(' ', '_')
+    if key in tank_settings:
+        return tank_settings[key]
+    for settings in tank_settings.values():
+        if settings.get('name', '').split(' - ')[0] == tank:
+            return settings
+    return {}
+
+
+def _day_of(timestamp):
+    return datetime.combine(timestamp.date(), datetime.min.time())
+
+
+def _contiguous_ranges(days):
+    """Group sorted days into (start, end) ranges with an exclusive end"""
+    ranges = []
+    for day in days:
+        if ranges and ranges[-1][1] == day:
+            ranges[-1][1] = day + timedelta(days=1)
+        else:
+            ranges.append([day, day + timedelta(days=1)])
+    return [tuple(day_range) for day_range in ranges]
+
+
+def _chunked(start, end, days):
+    """Split the range start <= day < end into ranges of at most `days` days"""
+    chunks = []
+    while start < end:
+        chunk_end = min(start + timedelta(days=days), end)
+        chunks.append((start, chunk_end))
+        start = chunk_end
+    return chunks
+
+
+def _to_list(values, digits):
+    """Convert a numpy array to a JSON list, with NaN as null"""
+    return [None if np.isnan(value) else round(float(value), digits) for value in values]
@@ -0,0 +1,221 @@
+"""
+Multi-Farm Fleet Overview
+
+Loads a registry of farm databases and builds a head-office overview of the
+latest reading and open alerts on every farm. Farms are queried in parallel
+through a bounded thread pool with a per-farm timeout, so the overview takes
+about as long as the slowest farm, and farms that fail or time out are
+reported without holding back the others. The result is cached for a short TTL.
+"""
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from threading import Lock
+
+import pymongo
+from pymongo import MongoClient
+
+from database import MIN_MAX_STALENESS_SECONDS, build_display_read_preference
+from sensor_schema import (STATE_V2, V2_COLLECTION, SensorRegistry, decode_document,
+                           read_schema_state)
+
+
+class FarmRegistry:
+    """The farms shown on the fleet overview"""
+
+    def __init__(self, farms):
+        self.farms = farms
+
+    @classmethod
+    def from_env(cls):
+        """
+        Load farms from the JSON file named by FLEET_CONFIG, or from the
+        FLEET_FARMS environment variable holding the same JSON list:
+            [{"id": "farm-01", "name": "North Bay", "uri": "mongodb://...",
+              "database": "aquatech_db", "timeout_seconds": 3}]
+        """
+        try:
+            config_path = os.getenv('FLEET_CONFIG')
+            if config_path:
+                with open(config_path) as f:
+                    entries = json.load(f)
+            else:
+                entries = json.loads(os.getenv('FLEET_FARMS', '[]'))
+            if not isinstance(entries, list):
+                raise ValueError("expected a JSON list of farms")
+        except Exception as e:
+            print(f"⚠️ Could not load fleet registry: {e}")
+            entries = []
+
+        # A malformed entry only drops that farm, never the whole site
+        farms = []
+        for index, farm in enumerate(entries):
+            if not isinstance(farm, dict) or not farm.get('id') or not farm.get('uri'):
+                print(f"⚠️ Skipping fleet registry entry {index}: 'id' and 'uri' are required")
+                continue
+            farm.setdefault('name', farm['id'])
+            farm.setdefault('database', 'aquatech_db')
+            farms.append(farm)
+
+        if farms:
+            print(f"✅ Loaded fleet registry with {len(farms)} farms")
+        return cls(farms)
+
+
+class FleetOverview:
+    """Parallel, cached fan-out over every farm in the registry"""
+
+    def __init__(self, registry, max_workers=32, timeout_seconds=3.0, ttl_seconds=15,
+                 alert_limit=5):
+        self.registry = registry
+        self.timeout_seconds = timeout_seconds
+        self.ttl_seconds = ttl_seconds
+        self.alert_limit = alert_limit
+        self.read_preference = build_display_read_preference(
+            os.getenv('MONGODB_DISPLAY_READ_PREFERENCE', 'secondaryPreferred'),
+            int(os.getenv('MONGODB_MAX_STALENESS_SECONDS', str(MIN_MAX_STALENESS_SECONDS)))
+        )
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix='fleet')
+        self._clients = {}
+        self._registries = {}
+        self._clients_lock = Lock()
+        self._refresh_lock = Lock()
+        self._cached = None
+        self._cached_at = 0
+
+    @classmethod
+    def from_env(cls):
+        """Create the overview from FLEET_* environment variables"""
+        return cls(
+            FarmRegistry.from_env(),
+            max_workers=int(os.getenv('FLEET_MAX_WORKERS', '32')),
+            timeout_seconds=float(os.getenv('FLEET_TIMEOUT_SECONDS', '3')),
+            ttl_seconds=float(os.getenv('FLEET_CACHE_TTL_SECONDS', '15'))
+        )
+
+    def get_overview(self):
+        """Get the cached overview, refreshing it once the TTL has expired"""
+        if self._is_fresh():
+            return self._cached
+
+        # Only one request refreshes; concurrent requests wait and reuse it
+        with self._refresh_lock:
+            if not self._is_fresh():
+                self._cached = self._collect()
+                self._cached_at = time.monotonic()
+            return self._cached
+
+    def _is_fresh(self):
+        return self._cached is not None and time.monotonic() - self._cached_at < self.ttl_seconds
+
+    def _collect(self):
+        """Query every farm in parallel and gather partial results"""
+        started_at = time.monotonic()
+        futures = {
+            self._executor.submit(self._query_farm, farm): farm
+            for farm in self.registry.farms
+        }
+
+        # Each farm's queries share one driver-enforced budget (see
+        # _query_farm); this bounds the whole fan-out in case a farm stalls
+        # somewhere the driver cannot interrupt
+        longest_timeout = max([self._farm_timeout(farm) for farm in self.registry.farms],
+                              default=0)
+        done, _ = wait(futures, timeout=longest_timeout + 1)
+
+        farms = []
+        for future, farm in futures.items():
+            summary = {'id': farm['id'], 'name': farm['name']}
+            if future not in done:
+                future.cancel()
+                summary.update(status='timeout', error='Farm did not respond in time')
+            elif future.exception() is not None:
+                summary.update(status='error', error=str(future.exception()))
+            else:
+                summary.update(status='ok', **future.result())
+            farms.append(summary)
+
+        return {
+            'farms': farms,
+            'farm_count': len(farms),
+            'responding': sum(1 for farm in farms if farm['status'] == 'ok'),
+            'open_alert_count': sum(farm.get('open_alert_count', 0) for farm in farms),
+            'generated_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'elapsed_ms': round((time.monotonic() - started_at) * 1000)
+        }
+
+    def _query_farm(self, farm):
+        """Fetch the latest reading and open alerts from one farm"""
+        started_at = time.monotonic()
+        # One budget for every query to this farm, not one per operation
+        with pymongo.timeout(self._farm_timeout(farm)):
+            db = self._client_for(farm)[farm['database']]
+
+            # Farms may still use the original schema or the compact version 2
+            schema = read_schema_state(db)
+            if schema['state'] == STATE_V2:
+                time_key = 'te' if schema['pack_seconds'] else 't'
+                document = db[V2_COLLECTION].find_one(sort=[(time_key, -1)])
+                latest = None
+                if document:
+                    latest = decode_document(document, self._registry_for(farm, db))[-1]
+            else:
+                latest = db.sensor_data.find_one(sort=[("timestamp", -1)])
+            if latest:
+                latest['_id'] = str(latest['_id'])
+                latest['timestamp'] = latest['timestamp'].strftime('%Y-%m-%d %H:%M:%S')
+
+            alerts = []
+            for alert in db.alerts.find({"acknowledged": False},
+                                        sort=[("timestamp", -1)],
+                                        limit=self.alert_limit):
+                alerts.append({
+                    'type': alert['type'],
+                    'message': alert['message'],
+                    'time': alert['timestamp'].strftime('%Y-%m-%d %H:%M:%S')
+                })
+
+            # The list is capped for display, so the total is counted separately
+            open_alert_count = len(alerts)
+            if open_alert_count == self.alert_limit:
+                open_alert_count = db.alerts.count_documents({"acknowledged": False})
+
+            return {
+                'latest_reading': latest,
+                'open_alerts': alerts,
+                'open_alert_count': open_alert_count,
+                'elapsed_ms': round((time.monotonic() - started_at) * 1000)
+            }
+
+    def _client_for(self, farm):
+        """Get the pooled client for a farm, creating it on first use"""
+        with self._clients_lock:
+            client = self._clients.get(farm['id'])
+            if client is None:
+                timeout_ms = int(self._farm_timeout(farm) * 1000)
+                client = MongoClient(
+                    farm['uri'],
+                    timeoutMS=timeout_ms,
+                    serverSelectionTimeoutMS=timeout_ms,
+                    connectTimeoutMS=timeout_ms,
+                    read_preference=self.read_preference
+                )
+                self._clients[farm['id']] = client
+            return client
+
+    def _registry_for(self, farm, db):
+        """Get the cached sensor registry for a farm's database"""
+        with self._clients_lock:
+            if farm['id'] not in self._registries:
+                self._registries[farm['id']] = SensorRegistry(db)
+            return self._registries[farm['id']]
+
+    def _farm_timeout(self, farm):
+        return float(farm.get('timeout_seconds', self.timeout_seconds))
+
+
+# Global fleet overview instance
+fleet = FleetOverview.from_env()
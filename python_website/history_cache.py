@@ -0,0 +1,142 @@
+"""
+Sliding-Window Sensor History Cache
+
+Keeps the most recent N hours of readings per (sensor, window) in worker memory.
+After the first load only readings from a short lookback before the last cached
+timestamp are fetched, so readings committed late are still picked up. Aged-out
+points are dropped from the front of the window, and whole windows are evicted
+least-recently-used first once the point budget is exceeded.
+MongoDB is queried without holding the cache lock, so reads of different
+windows do not wait for each other.
+"""
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+from threading import Lock
+
+
+class _Window:
+    """Cached readings for one (sensor, hours) key, oldest first"""
+
+    def __init__(self, records):
+        self.points = deque(records)
+
+    @property
+    def newest_timestamp(self):
+        return self.points[-1]['timestamp'] if self.points else None
+
+    def merge(self, records, since):
+        """Merge readings fetched from `since` on, skipping ones already cached"""
+        overlap = []
+        while self.points and self.points[-1]['timestamp'] >= since:
+            overlap.append(self.points.pop())
+        overlap.reverse()
+
+        cached_ids = {record['_id'] for record in overlap}
+        fresh = [r for r in records if r['_id'] not in cached_ids]
+        # A late reading can be older than cached ones; sorted() is stable, so
+        # readings sharing a timestamp keep their order
+        self.points.extend(sorted(overlap + fresh, key=lambda r: r['timestamp']))
+        return len(fresh)
+
+    def evict_before(self, window_start):
+        """Drop readings that have aged out of the window"""
+        evicted = 0
+        while self.points and self.points[0]['timestamp'] < window_start:
+            self.points.popleft()
+            evicted += 1
+        return evicted
+
+
+class SlidingWindowCache:
+    """Per-process LRU cache of sliding history windows"""
+
+    def __init__(self, fetch, max_points=100000, lookback_seconds=300):
+        """
+        `fetch(since, sensor_id)` must return readings with timestamp >= since,
+        sorted oldest first, each with a string `_id` and a `timestamp`.
+        Delta fetches start `lookback_seconds` before the newest cached
+        reading, to catch readings that were committed out of order.
+        """
+        self._fetch = fetch
+        self.max_points = max_points
+        self.lookback = timedelta(seconds=lookback_seconds)
+        self._windows = OrderedDict()
+        self._total_points = 0
+        # Guards the windows and point budget; never held while fetching
+        self._lock = Lock()
+        # Serializes fetches for the same window, so they are not duplicated
+        self._window_locks = {}
+        # Bumped by invalidate(), so fetches that overlap it are not cached
+        self._generation = 0
+        self.stats = {'hits': 0, 'misses': 0, 'delta_points': 0, 'evicted_windows': 0}
+
+    def get(self, hours, sensor_id=None):
+        """Return copies of the readings from the last `hours` hours"""
+        key = (sensor_id, hours)
+        window_start = datetime.now() - timedelta(hours=hours)
+
+        with self._lock:
+            window_lock = self._window_locks.setdefault(key, Lock())
+
+        with window_lock:
+            with self._lock:
+                window = self._windows.get(key)
+                generation = self._generation
+            full_load = window is None or window.newest_timestamp is None
+            if full_load:
+                since = window_start
+            else:
+                since = max(window_start, window.newest_timestamp - self.lookback)
+
+            records = self._fetch(since, sensor_id)
+
+            with self._lock:
+                if generation == self._generation:
+                    return self._store(key, window, full_load, records, since, window_start)
+
+        # The cache was invalidated during the fetch, so the readings are not
+        # cached, and a delta cannot be applied to the dropped window
+        if not full_load:
+            records = self._fetch(window_start, sensor_id)
+        return [dict(record) for record in records]
+
+    def _store(self, key, window, full_load, records, since, window_start):
+        """Merge fetched readings into the cache; the caller holds the lock"""
+        if full_load:
+            previous = self._windows.pop(key, None)
+            if previous is not None:
+                self._total_points -= len(previous.points)
+            window = _Window(records)
+            self._total_points += len(window.points)
+            self.stats['misses'] += 1
+        else:
+            if self._windows.get(key) is not window:
+                # Evicted by another read while this one was fetching
+                self._total_points += len(window.points)
+            added = window.merge(records, since)
+            self._total_points += added
+            self.stats['delta_points'] += added
+            self.stats['hits'] += 1
+
+        self._windows[key] = window
+        self._total_points -= window.evict_before(window_start)
+        self._windows.move_to_end(key)
+        self._enforce_budget()
+
+        # Callers add display fields to the records, so hand out copies
+        return [dict(record) for record in window.points]
+
+    def invalidate(self):
+        """Drop every cached window"""
+        with self._lock:
+            self._windows.clear()
+            self._total_points = 0
+            self._generation += 1
+
+    def _enforce_budget(self):
+        # The most recently used window is always kept, even if it alone
+        # exceeds the budget
+        while self._total_points > self.max_points and len(self._windows) > 1:
+            _, evicted = self._windows.popitem(last=False)
+            self._total_points -= len(evicted.points)
+            self.stats['evicted_windows'] += 1
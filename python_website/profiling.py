@@ -0,0 +1,105 @@
+"""
+On-Demand Request Profiling
+
+Samples the stack of the thread handling a request and writes it as a folded
+stack file ("frame;frame;frame count" per line), which flamegraph.pl, inferno
+and speedscope can render. Profiling is opt-in per request, either with an
+X-Profile header matching PROFILE_TOKEN or by random sampling with
+PROFILE_SAMPLE_RATE, so normal traffic pays nothing.
+"""
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+from flask import g, request
+
+# Sampling interval in seconds; 5 ms keeps overhead low while still
+# resolving the hot paths of a request that takes tens of milliseconds
+DEFAULT_INTERVAL = 0.005
+
+
+class SamplingProfiler:
+    """Periodically samples one thread's stack from a background thread"""
+
+    def __init__(self, thread_id, interval=DEFAULT_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.samples[';'.join(reversed(stack))] += 1
+
+    def folded(self):
+        """Return the samples in folded stack format"""
+        return ''.join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+def init_profiling(app):
+    """Register the request hooks that start and stop per-request profiles"""
+    token = os.getenv('PROFILE_TOKEN')
+    sample_rate = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+    profile_dir = os.getenv('PROFILE_DIR', os.path.join(app.root_path, 'profiles'))
+    app.config['PROFILE_DIR'] = profile_dir
+
+    @app.before_request
+    def start_profile():
+        requested = token and request.headers.get('X-Profile') == token
+        if not requested and not (sample_rate and random.random() < sample_rate):
+            return
+
+        g.profiler = SamplingProfiler(threading.get_ident())
+        g.profile_started_at = time.perf_counter()
+        g.profiler.start()
+
+    @app.after_request
+    def finish_profile(response):
+        profiler = g.pop('profiler', None)
+        if profiler is None:
+            return response
+
+        profiler.stop()
+        elapsed_ms = (time.perf_counter() - g.pop('profile_started_at')) * 1000
+        endpoint = re.sub(r'[^A-Za-z0-9_]', '_', request.endpoint or 'unknown')
+        filename = f"{time.strftime('%Y%m%d-%H%M%S')}-{endpoint}-{elapsed_ms:.0f}ms.folded"
+
+        try:
+            os.makedirs(profile_dir, exist_ok=True)
+            with open(os.path.join(profile_dir, filename), 'w') as f:
+                f.write(profiler.folded())
+            response.headers['X-Profile-File'] = filename
+        except Exception as e:
+            print(f"⚠️ Could not write request profile: {e}")
+
+        return response
+
+
+def list_profiles(profile_dir, limit=50):
+    """List the most recent profile files, newest first"""
+    try:
+        names = [name for name in os.listdir(profile_dir) if name.endswith('.folded')]
+    except FileNotFoundError:
+        return []
+    return sorted(names, reverse=True)[:limit]
@@ -0,0 +1,65 @@
+"""
+Read Routing Metrics
+
+Counts which route (primary or display) each AquaTechDB query was sent to, and
+which replica set member actually served each command, so read scale-out can
+be verified from the running application.
+"""
+from collections import Counter
+from threading import Lock
+
+from pymongo import monitoring
+
+
+class RoutingMetrics(monitoring.CommandListener):
+    """Command listener that tallies routing decisions and serving members"""
+
+    def __init__(self):
+        self._lock = Lock()
+        self.decisions = Counter()
+        self.commands_by_server = Counter()
+        self.failures_by_server = Counter()
+
+    def record_decision(self, route, operation):
+        """Record that `operation` was routed to `route` ('primary' or 'display')"""
+        with self._lock:
+            self.decisions[(route, operation)] += 1
+
+    def started(self, event):
+        with self._lock:
+            self.commands_by_server[_address(event.connection_id)] += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        with self._lock:
+            self.failures_by_server[_address(event.connection_id)] += 1
+
+    def snapshot(self, client=None):
+        """Return the counters as a JSON-serializable dict"""
+        server_types = {}
+        if client is not None:
+            for address, server in client.topology_description.server_descriptions().items():
+                server_types[_address(address)] = server.server_type_name
+
+        with self._lock:
+            decisions = {}
+            for (route, operation), count in self.decisions.items():
+                decisions.setdefault(route, {})[operation] = count
+
+            servers = {
+                address: {
+                    'commands': count,
+                    'failures': self.failures_by_server.get(address, 0),
+                    'type': server_types.get(address, 'Unknown')
+                }
+                for address, count in self.commands_by_server.items()
+            }
+
+        return {'decisions': decisions, 'servers': servers}
+
+
+def _address(connection_id):
+    host, port = connection_id
+    return f"{host}:{port}"
@@ -0,0 +1,396 @@
+"""
+Compact Sensor Storage Schema (version 2)
+
+Version 1 stores each reading in `sensor_data` with long field names, a naive
+local timestamp and the sensor/tank names repeated in every document:
+    {"timestamp": datetime, "ph": 7.1, "temperature": 24.3, "dissolved_oxygen": 8.2,
+     "turbidity": 12.0, "salinity": 25.1, "ammonia": 0.31,
+     "location": "Tank A", "sensor_id": "SENSOR_001"}
+
+Version 2 stores readings in `sensor_readings` with short keys, UTC epoch
+seconds and an integer reference into the `sensors` registry:
+    {"v": 2, "s": 1, "t": 1760000000, "ph": 7.1, "tc": 24.3, "do": 8.2,
+     "tb": 12.0, "sa": 25.1, "nh": 0.31}
+
+With packing enabled, the readings of one sensor within a fixed time bucket
+share a single document, with one array per field. `dt` holds each reading's
+offset in seconds from the bucket start `t`, and `te` is the newest reading:
+    {"_id": "1:1759996800", "v": 2, "s": 1, "t": 1759996800, "te": 1760000000,
+     "n": 2, "dt": [3540, 3600], "ph": [7.1, 7.0], "tc": [24.3, 24.4], ...}
+
+Decoded packed readings get the id "<bucket _id>:<array index>". Arrays are
+only appended to, so the ids are stable.
+
+Live inserts always append. Copies made by the migration also record the
+version 1 _id in the bucket's `src` array and skip readings already recorded
+there, so resuming a migration does not duplicate readings.
+"""
+import threading
+import time
+from datetime import datetime
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+SCHEMA_VERSION = 2
+SCHEMA_META_COLLECTION = 'schema_meta'
+SENSOR_SCHEMA_ID = 'sensor_data'
+V2_COLLECTION = 'sensor_readings'
+SENSORS_COLLECTION = 'sensors'
+
+# Schema states: readings live in sensor_data (v1), are being copied while
+# sensor_data stays authoritative (migrating), or live in sensor_readings (v2)
+STATE_V1 = 'v1'
+STATE_MIGRATING = 'migrating'
+STATE_V2 = 'v2'
+
+# Version 1 field name → version 2 key
+FIELD_KEYS = {
+    'ph': 'ph',
+    'temperature': 'tc',
+    'dissolved_oxygen': 'do',
+    'turbidity': 'tb',
+    'salinity': 'sa',
+    'ammonia': 'nh',
+}
+
+# Sensor reference used for readings that carry neither sensor_id nor location
+UNKNOWN_SENSOR = 0
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+def to_epoch(timestamp):
+    """Convert a naive local datetime (as stored by version 1) to UTC epoch seconds"""
+    return int(timestamp.timestamp())
+
+
+def from_epoch(epoch):
+    """Convert UTC epoch seconds back to the naive local datetime routes expect"""
+    return datetime.fromtimestamp(epoch)
+
+
+def read_schema_state(database):
+    """Get the sensor schema metadata, defaulting to version 1"""
+    meta = database[SCHEMA_META_COLLECTION].find_one({'_id': SENSOR_SCHEMA_ID})
+    return meta or {'_id': SENSOR_SCHEMA_ID, 'state': STATE_V1, 'pack_seconds': 0}
+
+
+class SensorRegistry:
+    """
+    Maps (sensor_id, location) pairs to compact integer references. A sensor
+    moved to another tank gets a new reference, so each reading keeps the
+    tank it was taken in.
+    """
+
+    def __init__(self, database):
+        self.sensors = database[SENSORS_COLLECTION]
+        self.meta = database[SCHEMA_META_COLLECTION]
+        self._by_pair = {}
+        self._by_ref = {}
+        self._lock = threading.Lock()
+
+    def create_indexes(self):
+        # References used to be unique per sensor_id alone
+        if 'sensor_id_1' in self.sensors.index_information():
+            self.sensors.drop_index('sensor_id_1')
+        self.sensors.create_index([('sensor_id', 1), ('location', 1)], unique=True)
+
+    def ref_for(self, sensor_id, location=None):
+        """Get the integer reference for a sensor and location, registering it on first use"""
+        if sensor_id is None and location is None:
+            return UNKNOWN_SENSOR
+
+        pair = (sensor_id, location)
+        with self._lock:
+            if pair in self._by_pair:
+                return self._by_pair[pair]
+
+        query = {'sensor_id': sensor_id, 'location': location}
+        sensor = self.sensors.find_one(query)
+        if sensor is None:
+            counter = self.meta.find_one_and_update(
+                {'_id': 'sensor_refs'},
+                {'$inc': {'next': 1}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            sensor = dict(query, _id=counter['next'])
+            try:
+                self.sensors.insert_one(sensor)
+            except DuplicateKeyError:
+                # Registered concurrently by another worker
+                sensor = self.sensors.find_one(query)
+
+        self._remember(sensor)
+        return sensor['_id']
+
+    def find_refs(self, sensor_id):
+        """Get the references of a sensor in every location, without registering it"""
+        refs = []
+        for sensor in self.sensors.find({'sensor_id': sensor_id}):
+            self._remember(sensor)
+            refs.append(sensor['_id'])
+        return refs
+
+    def describe(self, ref):
+        """Get the (sensor_id, location) pair for a reference"""
+        if ref == UNKNOWN_SENSOR:
+            return (None, None)
+        with self._lock:
+            if ref in self._by_ref:
+                return self._by_ref[ref]
+        sensor = self.sensors.find_one({'_id': ref})
+        if sensor is None:
+            return (None, None)
+        self._remember(sensor)
+        return self._by_ref[ref]
+
+    def _remember(self, sensor):
+        pair = (sensor.get('sensor_id'), sensor.get('location'))
+        with self._lock:
+            self._by_pair[pair] = sensor['_id']
+            self._by_ref[sensor['_id']] = pair
+
+
+def encode_reading(reading, sensor_ref):
+    """Encode a version 1 reading as an unpacked version 2 document"""
+    document = {'v': SCHEMA_VERSION, 's': sensor_ref, 't': to_epoch(reading['timestamp'])}
+    if '_id' in reading:
+        document['_id'] = reading['_id']
+    for field, key in FIELD_KEYS.items():
+        if field in reading:
+            document[key] = reading[field]
+    return document
+
+
+def _packed_filter_and_update(reading, sensor_ref, pack_seconds, deduplicate):
+    epoch = to_epoch(reading['timestamp'])
+    bucket_start = epoch - epoch % pack_seconds
+    offset = epoch - bucket_start
+
+    push = {'dt': offset}
+    for field, key in FIELD_KEYS.items():
+        # Every array gets an entry so the columns stay aligned
+        push[key] = reading.get(field)
+
+    bucket_filter = {'_id': f"{sensor_ref}:{bucket_start}"}
+    if deduplicate:
+        # Skips readings the bucket already holds; if it does, the upsert
+        # collides on _id and the write is dropped as a duplicate
+        bucket_filter['src'] = {'$ne': reading['_id']}
+        push['src'] = reading['_id']
+
+    update = {'$setOnInsert': {'v': SCHEMA_VERSION, 's': sensor_ref, 't': bucket_start},
+              '$push': push,
+              '$max': {'te': epoch},
+              '$inc': {'n': 1}}
+    return bucket_filter, update
+
+
+def packed_update(reading, sensor_ref, pack_seconds, deduplicate=False):
+    """Build the upsert that adds a version 1 reading to its packed bucket"""
+    return UpdateOne(*_packed_filter_and_update(reading, sensor_ref, pack_seconds, deduplicate),
+                     upsert=True)
+
+
+def append_reading(collection, sensor_ref, reading, pack_seconds):
+    """Append one live reading to its packed bucket and return the reading's decoded id"""
+    bucket_filter, update = _packed_filter_and_update(reading, sensor_ref, pack_seconds,
+                                                      deduplicate=False)
+    for attempt in range(2):
+        try:
+            bucket = collection.find_one_and_update(
+                bucket_filter, update, projection={'n': 1}, upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            # $push and $inc apply together, so n - 1 is this reading's index
+            return f"{bucket['_id']}:{bucket['n'] - 1}"
+        except DuplicateKeyError:
+            # Another writer created the bucket first; appending again succeeds
+            if attempt:
+                raise
+
+
+def decode_document(document, registry):
+    """Translate a version 2 document into version 1 shaped readings"""
+    sensor_id, location = registry.describe(document['s'])
+
+    if 'dt' not in document:
+        reading = {'_id': str(document['_id']), 'timestamp': from_epoch(document['t'])}
+        for field, key in FIELD_KEYS.items():
+            if key in document:
+                reading[field] = document[key]
+        _add_sensor_fields(reading, sensor_id, location)
+        return [reading]
+
+    readings = []
+    for index in sorted(range(len(document['dt'])), key=document['dt'].__getitem__):
+        offset = document['dt'][index]
+        reading = {'_id': f"{document['_id']}:{index}",
+                   'timestamp': from_epoch(document['t'] + offset)}
+        for field, key in FIELD_KEYS.items():
+            values = document.get(key)
+            if values is not None and values[index] is not None:
+                reading[field] = values[index]
+        _add_sensor_fields(reading, sensor_id, location)
+        readings.append(reading)
+    return readings
+
+
+def _add_sensor_fields(reading, sensor_id, location):
+    # Version 1 readings may carry either field without the other
+    if location is not None:
+        reading['location'] = location
+    if sensor_id is not None:
+        reading['sensor_id'] = sensor_id
+
+
+def write_readings(collection, registry, readings, pack_seconds, deduplicate=False):
+    """
+    Write version 1 shaped readings to the version 2 collection. With
+    `deduplicate`, a packed reading whose version 1 _id its bucket already
+    holds is treated as already copied and skipped.
+    """
+    if not readings:
+        return
+
+    if not pack_seconds:
+        documents = [encode_reading(reading, registry.ref_for(reading.get('sensor_id'),
+                                                              reading.get('location')))
+                     for reading in readings]
+        try:
+            collection.insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            # Documents keep their version 1 _id, so re-copies are duplicates
+            _raise_unless_duplicates(e)
+        return
+
+    operations = [packed_update(reading, registry.ref_for(reading.get('sensor_id'),
+                                                          reading.get('location')),
+                                pack_seconds, deduplicate)
+                  for reading in readings]
+    try:
+        collection.bulk_write(operations, ordered=False)
+    except BulkWriteError as e:
+        _raise_unless_duplicates(e)
+        # A collision can also mean another writer created the same bucket
+        # first; retrying once appends the reading unless it really is a duplicate
+        for error in e.details['writeErrors']:
+            try:
+                collection.bulk_write([operations[error['index']]])
+            except BulkWriteError as retry_error:
+                _raise_unless_duplicates(retry_error)
+
+
+def _raise_unless_duplicates(error):
+    if any(write_error['code'] != DUPLICATE_KEY_ERROR
+           for write_error in error.details.get('writeErrors', [])):
+        raise error
+    if error.details.get('writeConcernErrors'):
+        raise error
+
+
+def create_v2_indexes(collection, pack_seconds):
+    """Create the time-range indexes for the version 2 collection"""
+    # Packed buckets are found by their newest reading, so a bucket that
+    # started before a window but continues into it is still returned
+    time_key = 'te' if pack_seconds else 't'
+    collection.create_index([(time_key, -1)])
+    collection.create_index([('s', 1), (time_key, 1)])
+
+
+def migrate_to_v2(database, pack_seconds=0, batch_size=5000, catch_up_delay=35, progress=print):
+    """
+    Copy version 1 readings into the version 2 collection while the
+    application keeps running.
+
+    Readings are copied in (timestamp, _id) order from a checkpoint stored in
+    schema_meta, so an interrupted migration resumes where it stopped. Until
+    the copy has caught up, sensor_data remains authoritative and new readings
+    keep landing there. Once it has caught up, the state flips to v2 and a
+    final pass copies readings from workers that had not yet seen the flip.
+    The migration is only complete once that pass has run, so rerunning an
+    interrupted migration after the flip still runs it.
+    """
+    meta_collection = database[SCHEMA_META_COLLECTION]
+    source = database.sensor_data
+    target = database[V2_COLLECTION]
+    registry = SensorRegistry(database)
+    registry.create_indexes()
+
+    meta = read_schema_state(database)
+    if meta['state'] == STATE_V2 and meta.get('completed_at'):
+        progress("✅ Sensor data already uses schema version 2")
+        return meta
+
+    if meta['state'] == STATE_V1:
+        meta = {'_id': SENSOR_SCHEMA_ID, 'state': STATE_MIGRATING, 'version': SCHEMA_VERSION,
+                'pack_seconds': pack_seconds, 'checkpoint': None, 'migrated': 0,
+                'started_at': datetime.now()}
+        meta_collection.replace_one({'_id': SENSOR_SCHEMA_ID}, meta, upsert=True)
+        progress(f"🚚 Starting migration to schema version 2 "
+                 f"({'packed ' + str(pack_seconds) + 's buckets' if pack_seconds else 'unpacked'})")
+    elif meta['state'] == STATE_MIGRATING:
+        pack_seconds = meta['pack_seconds']
+        progress(f"🔁 Resuming migration from {meta['migrated']:,} readings")
+    else:
+        pack_seconds = meta['pack_seconds']
+        progress("🔁 Resuming the final pass after the switch to schema version 2")
+
+    create_v2_indexes(target, pack_seconds)
+
+    def copy_batches():
+        total = source.estimated_document_count()
+        started_at = time.time()
+        copied_this_run = 0
+        while True:
+            query = {}
+            checkpoint = meta.get('checkpoint')
+            if checkpoint:
+                query = {'$or': [
+                    {'timestamp': {'$gt': checkpoint['timestamp']}},
+                    {'timestamp': checkpoint['timestamp'], '_id': {'$gt': checkpoint['_id']}}
+                ]}
+            batch = list(source.find(query, sort=[('timestamp', 1), ('_id', 1)], limit=batch_size))
+            if not batch:
+                return
+
+            write_readings(target, registry, batch, pack_seconds, deduplicate=True)
+
+            last = batch[-1]
+            meta['checkpoint'] = {'timestamp': last['timestamp'], '_id': last['_id']}
+            meta['migrated'] += len(batch)
+            meta_collection.update_one({'_id': SENSOR_SCHEMA_ID},
+                                       {'$set': {'checkpoint': meta['checkpoint'],
+                                                 'migrated': meta['migrated']}})
+
+            copied_this_run += len(batch)
+            rate = copied_this_run / max(time.time() - started_at, 1e-9)
+            remaining = max(total - meta['migrated'], 0)
+            progress(f"   {meta['migrated']:,}/{total:,} readings "
+                     f"({min(meta['migrated'] * 100 // max(total, 1), 100)}%) - "
+                     f"{rate:,.0f}/s, ~{remaining / max(rate, 1e-9):,.0f}s left")
+
+            if len(batch) < batch_size:
+                return
+
+    if meta['state'] != STATE_V2:
+        copy_batches()
+
+        meta['flipped_at'] = datetime.now()
+        meta_collection.update_one({'_id': SENSOR_SCHEMA_ID},
+                                   {'$set': {'state': STATE_V2, 'flipped_at': meta['flipped_at']}})
+        progress("🔀 Switched reads and writes to schema version 2")
+
+    # Workers re-read the schema state periodically; readings they wrote to
+    # sensor_data before noticing the switch are copied by this final pass
+    waited = (datetime.now() - meta['flipped_at']).total_seconds()
+    time.sleep(max(catch_up_delay - waited, 0))
+    copy_batches()
+
+    meta_collection.update_one({'_id': SENSOR_SCHEMA_ID},
+                               {'$set': {'completed_at': datetime.now()}})
+    progress(f"✅ Migration complete - {meta['migrated']:,} readings copied. "
+             f"sensor_data can be dropped once the new schema is verified.")
+    return read_schema_state(database)
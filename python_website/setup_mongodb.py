@@ -8,12 +8,31 @@ It provides options to:
 2. Install MongoDB Community Server (provides instructions)
 3. Set up MongoDB Atlas cloud connection
 4. Initialize the database with sample data
+5. Generate high-volume synthetic sensor data for load testing
+
+Load-test data is generated from the command line, for example:
+    python setup_mongodb.py generate --tanks 20 --sensors-per-tank 5 \
+        --interval 10 --days 30 --workers 8
 """
 
+import argparse
+import math
 import os
 import subprocess
 import sys
+import time
+from datetime import datetime, timedelta
+from multiprocessing import Pool
 from database import AquaTechDB
+from feed_analytics import clear_cached_days
+from sensor_schema import FIELD_KEYS, SCHEMA_VERSION, STATE_V2, migrate_to_v2
+
+# Feeding times (hour of day) used to shape the synthetic ammonia/DO response
+GENERATOR_FEEDING_HOURS = [6, 10, 14, 18, 22]
+
+# Per-process state for generator workers, set up by _init_generator_worker
+_worker_collection = None
+_worker_config = None
 
 def check_mongodb_local():
     """Check if MongoDB is installed and running locally"""
@@ -117,8 +136,400 @@ def test_database_connection():
         print(f"❌ Database connection test failed: {e}")
         return False
 
+def check_read_routing(iterations=200):
+    """Run display queries and show which replica set members served them"""
+    print("\n🔀 Checking Read Routing:")
+    print("=" * 40)
+    
+    db = AquaTechDB()
+    if db.client is None:
+        print("❌ Failed to connect to MongoDB")
+        return False
+    
+    print(f"📖 Display read preference: {db.display_read_preference.document}")
+    
+    # Bypass the history cache so every iteration reaches the server
+    db.history_cache = None
+    for _ in range(iterations):
+        db.get_historical_sensor_data(1)
+        db.get_recent_alerts(3)
+    db.get_latest_sensor_data()
+    
+    metrics = db.get_routing_metrics()
+    for route, operations in metrics['decisions'].items():
+        print(f"   {route}: {operations}")
+    for address, server in sorted(metrics['servers'].items()):
+        print(f"   {address} ({server['type']}): {server['commands']} commands")
+    
+    db.close_connection()
+    return True
+
+def _tank_name(index):
+    """Name tanks Tank A..Tank Z, then Tank 27, Tank 28, ..."""
+    if index < 26:
+        return f"Tank {chr(ord('A') + index)}"
+    return f"Tank {index + 1}"
+
+def _init_generator_worker(connection_string, database_name, collection_name, config):
+    """Open one MongoDB connection per generator process"""
+    global _worker_collection, _worker_config
+    import pymongo
+    client = pymongo.MongoClient(connection_string, w=1)
+    _worker_collection = client[database_name][collection_name]
+    _worker_config = config
+
+def generate_sensor_series(sensor_index, start_step, count, config):
+    """
+    Generate `count` consecutive readings for one sensor as numpy arrays.
+
+    Every signal is a pure function of time plus per-chunk noise, so chunks of
+    the same sensor can be generated independently in different processes:
+    - temperature follows a diurnal cycle plus a slow multi-day drift
+    - dissolved oxygen tracks the temperature-dependent saturation level and
+      dips while fish digest after each feeding
+    - ammonia and turbidity spike shortly after each feeding and decay
+    - pH drops slightly with ammonia and rises with daytime photosynthesis
+    """
+    import numpy as np
+
+    # Sensor-specific constants are derived from the sensor index so every
+    # chunk of the same sensor agrees on them
+    params = np.random.default_rng([config['seed'], sensor_index])
+    base_temp = params.uniform(22, 26)
+    base_salinity = params.uniform(20, 30)
+    drift_phases = params.uniform(0, 2 * math.pi, size=3)
+    feed_response = params.uniform(0.6, 1.4)
+
+    noise = np.random.default_rng([config['seed'], sensor_index, start_step])
+
+    steps = np.arange(start_step, start_step + count, dtype=np.int64)
+    timestamps = np.datetime64(config['start'], 's') + steps * config['interval_seconds']
+    seconds_of_day = (timestamps - timestamps.astype('datetime64[D]')).astype(np.int64)
+    hour = seconds_of_day / 3600.0
+    elapsed_days = steps * config['interval_seconds'] / 86400.0
+
+    # Temperature: diurnal cycle peaking mid-afternoon plus weather drift
+    drift = (0.8 * np.sin(2 * math.pi * elapsed_days / 5.3 + drift_phases[0]) +
+             0.5 * np.sin(2 * math.pi * elapsed_days / 11.7 + drift_phases[1]) +
+             0.3 * np.sin(2 * math.pi * elapsed_days / 2.1 + drift_phases[2]))
+    temperature = (base_temp + 1.5 * np.sin(2 * math.pi * (hour - 9) / 24) +
+                   drift + noise.normal(0, 0.15, count))
+
+    # Hours since the most recent feeding, and a pulse peaking ~1.5 h after it
+    feeding_hours = np.array(GENERATOR_FEEDING_HOURS, dtype=np.float64)
+    hours_since_feed = np.min((hour[:, None] - feeding_hours[None, :]) % 24, axis=1)
+    feed_pulse = feed_response * (hours_since_feed / 1.5) * np.exp(1 - hours_since_feed / 1.5)
+
+    # Photosynthesis: positive during daylight, zero at night
+    daylight = np.clip(np.sin(2 * math.pi * (hour - 6) / 24), 0, None)
+
+    # Dissolved oxygen: freshwater saturation curve, inversely tracking temperature
+    saturation = (14.652 - 0.41022 * temperature + 0.007991 * temperature ** 2 -
+                  0.000077774 * temperature ** 3)
+    dissolved_oxygen = np.clip(
+        0.85 * saturation + 0.6 * daylight - 1.2 * feed_pulse + noise.normal(0, 0.2, count),
+        0.5, None)
+
+    ammonia = np.clip(0.15 + 0.9 * feed_pulse + noise.normal(0, 0.05, count), 0, None)
+    ph = 7.4 + 0.25 * daylight - 0.2 * ammonia + noise.normal(0, 0.05, count)
+    turbidity = np.clip(4 + 12 * feed_pulse + noise.normal(0, 1.0, count), 0, None)
+    salinity = base_salinity + 0.5 * drift + noise.normal(0, 0.1, count)
+
+    return {
+        'timestamp': timestamps,
+        'epoch': config['start_epoch'] + steps * config['interval_seconds'],
+        'ph': np.round(ph, 2),
+        'temperature': np.round(temperature, 1),
+        'dissolved_oxygen': np.round(dissolved_oxygen, 2),
+        'turbidity': np.round(turbidity, 1),
+        'salinity': np.round(salinity, 2),
+        'ammonia': np.round(ammonia, 3),
+    }
+
+def _generate_and_insert(task):
+    """Generator worker: build one batch of readings and bulk insert it"""
+    sensor_index, start_step, count = task
+    config = _worker_config
+    series = generate_sensor_series(sensor_index, start_step, count, config)
+
+    if config['schema_version'] == SCHEMA_VERSION:
+        return _insert_v2_series(series, config['sensor_refs'][sensor_index], config['pack_seconds'])
+
+    location = _tank_name(sensor_index // config['sensors_per_tank'])
+    sensor_id = f"SENSOR_{sensor_index + 1:03d}"
+
+    # tolist() converts whole columns to Python objects in C, which is far
+    # cheaper than converting element by element while building documents
+    columns = [series['timestamp'].astype('datetime64[ms]').tolist(),
+               series['ph'].tolist(),
+               series['temperature'].tolist(),
+               series['dissolved_oxygen'].tolist(),
+               series['turbidity'].tolist(),
+               series['salinity'].tolist(),
+               series['ammonia'].tolist()]
+
+    documents = [
+        {
+            "timestamp": timestamp,
+            "ph": ph,
+            "temperature": temperature,
+            "dissolved_oxygen": dissolved_oxygen,
+            "turbidity": turbidity,
+            "salinity": salinity,
+            "ammonia": ammonia,
+            "location": location,
+            "sensor_id": sensor_id
+        }
+        for timestamp, ph, temperature, dissolved_oxygen, turbidity, salinity, ammonia
+        in zip(*columns)
+    ]
+
+    _worker_collection.insert_many(documents, ordered=False, bypass_document_validation=True)
+    return len(documents)
+
+def _insert_v2_series(series, sensor_ref, pack_seconds):
+    """Bulk insert a generated series using the compact version 2 schema"""
+    import numpy as np
+    from pymongo import UpdateOne
+
+    epochs = series['epoch']
+    columns = {key: series[field].tolist() for field, key in FIELD_KEYS.items()}
+
+    if not pack_seconds:
+        keys = list(columns)
+        documents = [
+            dict(zip(keys, values), v=SCHEMA_VERSION, s=sensor_ref, t=epoch)
+            for epoch, *values in zip(epochs.tolist(), *columns.values())
+        ]
+        _worker_collection.insert_many(documents, ordered=False, bypass_document_validation=True)
+        return len(documents)
+
+    # One upsert per bucket; batches may split a bucket, so buckets are
+    # appended to rather than replaced
+    buckets = epochs - epochs % pack_seconds
+    offsets = (epochs - buckets).tolist()
+    boundaries = [0] + (np.flatnonzero(np.diff(buckets)) + 1).tolist() + [len(epochs)]
+
+    operations = []
+    for start, end in zip(boundaries[:-1], boundaries[1:]):
+        bucket_start = int(buckets[start])
+        push = {'dt': {'$each': offsets[start:end]}}
+        for key, values in columns.items():
+            push[key] = {'$each': values[start:end]}
+        operations.append(UpdateOne(
+            {'_id': f"{sensor_ref}:{bucket_start}"},
+            {'$setOnInsert': {'v': SCHEMA_VERSION, 's': sensor_ref, 't': bucket_start},
+             '$push': push,
+             '$max': {'te': int(epochs[end - 1])},
+             '$inc': {'n': end - start}},
+            upsert=True
+        ))
+
+    _worker_collection.bulk_write(operations, ordered=False, bypass_document_validation=True)
+    return len(epochs)
+
+def generate_feeding_history(db, config, tanks, seed):
+    """Insert completed feedings for every full day of the generated period"""
+    import numpy as np
+
+    rng = np.random.default_rng([seed, tanks])
+    start = datetime.fromisoformat(config['start'])
+    today = datetime.combine(datetime.now().date(), datetime.min.time())
+    hourly = dict(config, interval_seconds=3600)
+    hours = int((today - start).total_seconds() // 3600)
+    if hours <= 0:
+        return 0
+
+    settings = (db.system_settings.find_one() or {}).get('tank_settings', {})
+    documents = []
+    for tank in range(tanks):
+        name = _tank_name(tank)
+        key = name.lower().replace(' ', '_')
+        if key not in settings:
+            settings[key] = {"name": name, "fish_species": "Atlantic Salmon", "fish_count": 500,
+                             "average_weight_g": int(rng.integers(400, 900)), "weighed_at": start}
+            db.system_settings.update_one({}, {"$set": {f"tank_settings.{key}": settings[key]}},
+                                          upsert=True)
+
+        # Daily mean temperature of the tank's first sensor
+        series = generate_sensor_series(tank * config['sensors_per_tank'], 0, hours, hourly)
+        day_values, index = np.unique(series['timestamp'].astype('datetime64[D]'), return_inverse=True)
+        temperature = np.bincount(index, weights=series['temperature']) / np.bincount(index)
+
+        # Fish get a share of their biomass that rises with temperature, and
+        # grow with the thermal growth coefficient model
+        fish_count = settings[key].get('fish_count', 500)
+        cube_roots = (np.cbrt(settings[key].get('average_weight_g', 500)) +
+                      2.8 / 1000 * (np.cumsum(temperature) - temperature))
+        biomass_kg = fish_count * cube_roots ** 3 / 1000
+        daily_feed = (biomass_kg * 0.025 * np.clip(1 + 0.1 * (temperature - 24), 0.5, 1.5) *
+                      rng.normal(1, 0.05, len(temperature)))
+
+        for day, feed_kg in zip(day_values.astype('datetime64[s]').tolist(), daily_feed.tolist()):
+            for hour in GENERATOR_FEEDING_HOURS:
+                completed_at = day + timedelta(hours=hour, minutes=int(rng.integers(0, 6)))
+                if completed_at < start:
+                    continue
+                documents.append({
+                    "date": day,
+                    "time": f"{hour:02d}:00",
+                    "amount_kg": round(feed_kg / len(GENERATOR_FEEDING_HOURS), 2),
+                    "status": "completed",
+                    "completed_at": completed_at,
+                    "tank": name,
+                    "generated": True
+                })
+
+    if documents:
+        db.feeding_schedules.insert_many(documents)
+    return len(documents)
+
+def generate_load_test_data(tanks=4, sensors_per_tank=1, interval_seconds=60, days=7,
+                            workers=None, batch_size=10000, seed=42, drop=False):
+    """Generate correlated synthetic sensor readings and bulk load them in parallel"""
+    print("\n🏭 Generating Load-Test Sensor Data:")
+    print("=" * 40)
+
+    db = AquaTechDB()
+    if db.client is None:
+        print("❌ Failed to connect to MongoDB")
+        return False
+
+    workers = workers or os.cpu_count() or 1
+    total_sensors = tanks * sensors_per_tank
+    steps_per_sensor = int(days * 86400 // interval_seconds)
+    total_readings = total_sensors * steps_per_sensor
+
+    print(f"📐 {tanks} tanks × {sensors_per_tank} sensors, every {interval_seconds}s for {days} days")
+    print(f"📈 {total_readings:,} readings in batches of {batch_size:,} across {workers} processes")
+
+    # Write in whichever storage schema the application currently reads
+    uses_v2 = db.sensor_schema['state'] == STATE_V2
+    collection = db.sensor_readings if uses_v2 else db.sensor_data
+    sensor_refs = []
+    if uses_v2:
+        sensor_refs = [db.sensor_registry.ref_for(f"SENSOR_{index + 1:03d}",
+                                                  _tank_name(index // sensors_per_tank))
+                       for index in range(total_sensors)]
+        print(f"🗜️ Writing compact schema version 2 documents "
+              f"(pack_seconds={db.sensor_schema['pack_seconds']})")
+
+    if drop:
+        collection.delete_many({})
+        db.feeding_schedules.delete_many({"generated": True})
+        print("🗑️ Cleared existing sensor readings and generated feedings")
+
+    # End the series at the current time so dashboards show the newest data
+    start = datetime.now().replace(microsecond=0) - timedelta(seconds=steps_per_sensor * interval_seconds)
+    config = {
+        'start': start.isoformat(),
+        'start_epoch': int(start.timestamp()),
+        'interval_seconds': interval_seconds,
+        'sensors_per_tank': sensors_per_tank,
+        'seed': seed,
+        'schema_version': SCHEMA_VERSION if uses_v2 else 1,
+        'sensor_refs': sensor_refs,
+        'pack_seconds': db.sensor_schema['pack_seconds'] if uses_v2 else 0,
+    }
+
+    tasks = [
+        (sensor_index, start_step, min(batch_size, steps_per_sensor - start_step))
+        for start_step in range(0, steps_per_sensor, batch_size)
+        for sensor_index in range(total_sensors)
+    ]
+
+    inserted = 0
+    started_at = time.time()
+    last_report = started_at
+    with Pool(workers, initializer=_init_generator_worker,
+              initargs=(db.connection_string, db.database_name, collection.name, config)) as pool:
+        for count in pool.imap_unordered(_generate_and_insert, tasks):
+            inserted += count
+            now = time.time()
+            if now - last_report >= 2 or inserted == total_readings:
+                rate = inserted / max(now - started_at, 1e-9)
+                print(f"   {inserted:,}/{total_readings:,} readings "
+                      f"({inserted * 100 // max(total_readings, 1)}%) - {rate:,.0f}/s")
+                last_report = now
+
+    elapsed = time.time() - started_at
+    print(f"✅ Inserted {inserted:,} sensor readings in {elapsed:.1f}s")
+
+    feedings = generate_feeding_history(db, config, tanks, seed)
+    print(f"✅ Inserted {feedings:,} completed feedings")
+
+    # Cached analytics for these days predate the new data; --drop also
+    # removed the data behind every older cached day
+    cleared = clear_cached_days(db.db, None if drop else start)
+    print(f"🧹 Cleared {cleared:,} cached feed analytics days")
+    db.close_connection()
+    return True
+
+def parse_generate_args(argv):
+    """Parse command line options for the load-test data generator"""
+    parser = argparse.ArgumentParser(
+        prog="setup_mongodb.py generate",
+        description="Generate high-volume synthetic sensor data for load testing"
+    )
+    parser.add_argument('--tanks', type=int, default=4, help="number of tanks")
+    parser.add_argument('--sensors-per-tank', type=int, default=1, help="sensors in each tank")
+    parser.add_argument('--interval', type=int, default=60, help="seconds between readings")
+    parser.add_argument('--days', type=float, default=7, help="days of history to generate")
+    parser.add_argument('--workers', type=int, default=None, help="insert processes (default: CPU count)")
+    parser.add_argument('--batch-size', type=int, default=10000, help="readings per bulk insert")
+    parser.add_argument('--seed', type=int, default=42, help="random seed for reproducible data")
+    parser.add_argument('--drop', action='store_true',
+                        help="delete existing sensor readings and generated feedings first")
+    return parser.parse_args(argv)
+
+def migrate_sensor_schema(pack_seconds=0, batch_size=5000):
+    """Migrate sensor readings to the compact version 2 schema"""
+    print("\n🗜️ Migrating Sensor Schema:")
+    print("=" * 40)
+
+    db = AquaTechDB()
+    if db.client is None:
+        print("❌ Failed to connect to MongoDB")
+        return False
+
+    migrate_to_v2(db.db, pack_seconds=pack_seconds, batch_size=batch_size)
+    db.close_connection()
+    return True
+
+def parse_migrate_args(argv):
+    """Parse command line options for the schema migration"""
+    parser = argparse.ArgumentParser(
+        prog="setup_mongodb.py migrate-schema",
+        description="Migrate sensor readings to the compact version 2 schema while the app runs"
+    )
+    parser.add_argument('--pack-seconds', type=int, default=0,
+                        help="pack each sensor's readings into buckets of this many seconds (0 = one reading per document)")
+    parser.add_argument('--batch-size', type=int, default=5000, help="readings copied per batch")
+    return parser.parse_args(argv)
+
 def main():
     """Main setup function"""
+    if len(sys.argv) > 1 and sys.argv[1] == 'generate':
+        args = parse_generate_args(sys.argv[2:])
+        generate_load_test_data(
+            tanks=args.tanks,
+            sensors_per_tank=args.sensors_per_tank,
+            interval_seconds=args.interval,
+            days=args.days,
+            workers=args.workers,
+            batch_size=args.batch_size,
+            seed=args.seed,
+            drop=args.drop
+        )
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == 'migrate-schema':
+        args = parse_migrate_args(sys.argv[2:])
+        migrate_sensor_schema(pack_seconds=args.pack_seconds, batch_size=args.batch_size)
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == 'routing':
+        check_read_routing()
+        return
+    
     print("🚀 AquaTech MongoDB Setup")
     print("=" * 30)
     
@@ -128,6 +539,7 @@ def main():
     print("3. Get MongoDB Atlas cloud setup instructions")
     print("4. Test database connection")
     print("5. Run all checks")
+    print("\n💡 For load-test data run: python setup_mongodb.py generate --help")
     
     try:
         choice = input("\nEnter your choice (1-5): ").strip()
@@ -0,0 +1,231 @@
+"""
+Slow Query Log
+
+Command listener that records AquaTechDB queries slower than a threshold. Each
+slow query is re-run with explain() on a background thread, so the request that
+triggered it is not delayed. The explain uses the query's own read preference,
+so display reads are explained on a secondary rather than the primary. Each
+query shape is explained at most once per interval; later occurrences reuse
+that plan. The winning plan and the keys/documents it examined are stored in a
+capped collection for the admin route.
+"""
+import json
+import queue
+import threading
+import time
+from datetime import datetime
+
+from bson import json_util
+from pymongo import monitoring
+from pymongo.read_preferences import (Nearest, Primary, PrimaryPreferred,
+                                      Secondary, SecondaryPreferred)
+
+# Commands whose plans explain() can show
+EXPLAINABLE_COMMANDS = {'find', 'aggregate', 'count', 'distinct'}
+
+# Driver-added fields that must not be passed back into explain
+INTERNAL_FIELDS = {'lsid', 'txnNumber', 'autocommit', 'startTransaction',
+                   'readConcern', 'writeConcern'}
+
+SLOW_QUERY_COLLECTION = 'slow_queries'
+
+# Read preference modes as sent in a command's $readPreference
+READ_PREFERENCE_MODES = {
+    'primaryPreferred': PrimaryPreferred,
+    'secondary': Secondary,
+    'secondaryPreferred': SecondaryPreferred,
+    'nearest': Nearest,
+}
+
+# Most query shapes whose last plan is remembered
+MAX_REMEMBERED_SHAPES = 1000
+
+
+class SlowQueryLog(monitoring.CommandListener):
+    """Captures slow queries together with their explain() plan"""
+
+    def __init__(self, threshold_ms=200, capped_size_bytes=16 * 1024 * 1024, max_pending=100,
+                 explain_interval_seconds=300):
+        self.threshold_ms = threshold_ms
+        self.capped_size_bytes = capped_size_bytes
+        self.explain_interval_seconds = explain_interval_seconds
+        # Query shape → (time it was explained, plan summary)
+        self._plans = {}
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._client = None
+        self._collection = None
+        self._worker = None
+
+    def attach(self, client, db):
+        """Start logging once the client is connected"""
+        try:
+            if SLOW_QUERY_COLLECTION not in db.list_collection_names():
+                db.create_collection(SLOW_QUERY_COLLECTION, capped=True,
+                                     size=self.capped_size_bytes)
+        except Exception as e:
+            print(f"⚠️ Could not create slow query collection: {e}")
+
+        self._client = client
+        self._collection = db[SLOW_QUERY_COLLECTION]
+
+    def started(self, event):
+        if self._collection is None or event.command_name not in EXPLAINABLE_COMMANDS:
+            return
+        # Never explain our own reads of the slow query log
+        if event.command.get(event.command_name) == SLOW_QUERY_COLLECTION:
+            return
+
+        with self._pending_lock:
+            self._pending[(event.connection_id, event.request_id)] = (
+                event.database_name, dict(event.command), event.connection_id)
+
+    def succeeded(self, event):
+        with self._pending_lock:
+            pending = self._pending.pop((event.connection_id, event.request_id), None)
+        if pending is None:
+            return
+
+        duration_ms = event.duration_micros / 1000
+        if duration_ms < self.threshold_ms:
+            return
+
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait((*pending, duration_ms, datetime.now()))
+        except queue.Full:
+            pass  # Under heavy load, dropping entries is better than blocking requests
+
+    def failed(self, event):
+        with self._pending_lock:
+            self._pending.pop((event.connection_id, event.request_id), None)
+
+    def _ensure_worker(self):
+        # Started lazily so it also runs in forked server workers
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name='slow-query-log', daemon=True)
+            self._worker.start()
+
+    def _run(self):
+        while True:
+            database_name, command, address, duration_ms, timestamp = self._queue.get()
+            try:
+                self._record(database_name, command, address, duration_ms, timestamp)
+            except Exception as e:
+                print(f"⚠️ Could not record slow query: {e}")
+
+    def _record(self, database_name, command, address, duration_ms, timestamp):
+        """Explain a slow query, unless its shape was explained recently, and store the summary"""
+        read_preference = _read_preference_for(command, address, self._client)
+        command = {key: value for key, value in command.items()
+                   if not key.startswith('$') and key not in INTERNAL_FIELDS}
+        command_name = next(iter(command))
+
+        shape = _query_shape(database_name, command_name, command)
+        explained_at, plan = self._plans.get(shape, (None, None))
+        if explained_at is None or time.monotonic() - explained_at > self.explain_interval_seconds:
+            plan = self._explain(database_name, command, read_preference)
+            if len(self._plans) >= MAX_REMEMBERED_SHAPES:
+                self._plans.clear()
+            self._plans[shape] = (time.monotonic(), plan)
+            plan_reused = False
+        else:
+            plan_reused = True
+
+        self._collection.insert_one({
+            'timestamp': timestamp,
+            'database': database_name,
+            'collection': command[command_name],
+            'command_name': command_name,
+            # Stored as extended JSON, since filters contain $-prefixed keys
+            'command': json_util.dumps(command),
+            'duration_ms': round(duration_ms, 1),
+            'plan_reused': plan_reused,
+            **plan
+        })
+
+    def _explain(self, database_name, command, read_preference):
+        """Run explain() with execution stats and summarize the winning plan"""
+        explain = self._client[database_name].command(
+            {'explain': command, 'verbosity': 'executionStats'},
+            read_preference=read_preference)
+        stats = _find_key(explain, 'executionStats') or {}
+        planner = _find_key(explain, 'queryPlanner') or {}
+        stages = _plan_stages(planner.get('winningPlan', {}))
+        return {
+            'plan': ' > '.join(stages),
+            'collection_scan': 'COLLSCAN' in stages,
+            'keys_examined': stats.get('totalKeysExamined'),
+            'docs_examined': stats.get('totalDocsExamined'),
+            'docs_returned': stats.get('nReturned'),
+        }
+
+    def get_recent(self, limit=50):
+        """Get the most recently logged slow queries"""
+        if self._collection is None:
+            return []
+        cursor = self._collection.find(sort=[('$natural', -1)], limit=limit)
+        entries = []
+        for entry in cursor:
+            entry['_id'] = str(entry['_id'])
+            entries.append(entry)
+        return entries
+
+
+def _read_preference_for(command, address, client):
+    """The read preference that sends the explain to the kind of member that ran the query"""
+    document = command.get('$readPreference') or {}
+    mode = READ_PREFERENCE_MODES.get(document.get('mode'))
+    if mode is not None:
+        return mode(tag_sets=document.get('tags'),
+                    max_staleness=document.get('maxStalenessSeconds', -1))
+
+    # Without $readPreference, the address shows whether a secondary served it
+    if address is not None and client.primary is not None and address != client.primary:
+        return SecondaryPreferred()
+    return Primary()
+
+
+def _query_shape(database_name, command_name, command):
+    """Key identifying a query with its values removed, e.g. {"t": {"$gte": ?}}"""
+    def strip_values(value):
+        if isinstance(value, dict):
+            return {key: strip_values(item) for key, item in value.items()}
+        if isinstance(value, list) and any(isinstance(item, (dict, list)) for item in value):
+            return [strip_values(item) for item in value]
+        return None
+
+    body = {key: strip_values(value) for key, value in command.items()
+            if key in ('filter', 'sort', 'projection', 'pipeline', 'query', 'key')}
+    return json.dumps([database_name, command_name, command[command_name], body], sort_keys=True)
+
+
+def _find_key(document, key):
+    """Depth-first search for a key in a nested explain() result"""
+    if isinstance(document, dict):
+        if key in document:
+            return document[key]
+        values = document.values()
+    elif isinstance(document, list):
+        values = document
+    else:
+        return None
+
+    for value in values:
+        found = _find_key(value, key)
+        if found is not None:
+            return found
+    return None
+
+
+def _plan_stages(plan):
+    """Flatten a winning plan into its stage names, outermost first"""
+    stages = []
+    while plan:
+        stage = plan.get('stage', '?')
+        if stage == 'IXSCAN':
+            stage = f"IXSCAN {plan.get('indexName', '')}".strip()
+        stages.append(stage)
+        plan = plan.get('inputStage') or (plan.get('inputStages') or [None])[0]
+    return stages
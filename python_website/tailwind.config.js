@@ -0,0 +1,9 @@
+/** Tailwind build configuration used by build_assets.py */
+module.exports = {
+  // Only classes that appear in the templates end up in the compiled CSS
+  content: ['./templates/**/*.html'],
+  theme: {
+    extend: {},
+  },
+  plugins: [],
+};
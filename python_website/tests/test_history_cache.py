@@ -0,0 +1,98 @@
+"""
+Tests for the sliding-window history cache. They need no MongoDB:
+    python -m unittest discover tests
+"""
+import threading
+import unittest
+from datetime import datetime, timedelta
+
+from history_cache import SlidingWindowCache
+
+
+def make_reading(reading_id, minutes_ago):
+    return {'_id': str(reading_id), 'timestamp': datetime.now() - timedelta(minutes=minutes_ago)}
+
+
+class SlidingWindowCacheTest(unittest.TestCase):
+
+    def test_delta_fetch_after_first_load(self):
+        readings = [make_reading(1, 30), make_reading(2, 20)]
+        calls = []
+
+        def fetch(since, sensor_id):
+            calls.append(since)
+            return [r for r in readings if r['timestamp'] >= since]
+
+        cache = SlidingWindowCache(fetch)
+        self.assertEqual([r['_id'] for r in cache.get(1)], ['1', '2'])
+
+        readings.append(make_reading(3, 10))
+        self.assertEqual([r['_id'] for r in cache.get(1)], ['1', '2', '3'])
+        # The second fetch starts one lookback before the newest cached reading
+        self.assertEqual(calls[1], readings[1]['timestamp'] - cache.lookback)
+        self.assertEqual(cache.stats['hits'], 1)
+
+    def test_late_reading_inside_the_lookback_is_merged_in_order(self):
+        readings = [make_reading(1, 30), make_reading(2, 10)]
+
+        def fetch(since, sensor_id):
+            return sorted((r for r in readings if r['timestamp'] >= since),
+                          key=lambda r: r['timestamp'])
+
+        cache = SlidingWindowCache(fetch, lookback_seconds=600)
+        cache.get(1)
+
+        # Committed after reading 2, but timestamped before it
+        readings.append(make_reading(3, 12))
+        self.assertEqual([r['_id'] for r in cache.get(1)], ['1', '3', '2'])
+        self.assertEqual(cache.stats['delta_points'], 1)
+
+    def test_slow_fetch_does_not_block_other_windows(self):
+        fetch_started = threading.Event()
+        release = threading.Event()
+
+        def fetch(since, sensor_id):
+            if sensor_id == 'slow':
+                fetch_started.set()
+                release.wait(5)
+            return [make_reading(sensor_id, 5)]
+
+        cache = SlidingWindowCache(fetch)
+        slow = threading.Thread(target=cache.get, args=(1, 'slow'))
+        slow.start()
+        self.assertTrue(fetch_started.wait(5))
+
+        # Another window is served while the slow fetch is still running
+        done = threading.Event()
+        threading.Thread(target=lambda: (cache.get(1, 'fast'), done.set()), daemon=True).start()
+        self.assertTrue(done.wait(2))
+
+        release.set()
+        slow.join(5)
+        self.assertFalse(slow.is_alive())
+
+    def test_fetch_that_invalidates_the_cache_returns(self):
+        # AquaTechDB invalidates the cache when the sensor schema changes;
+        # doing so while a fetch runs must neither deadlock nor cache the
+        # readings fetched from the old storage
+        cache = SlidingWindowCache(lambda since, sensor_id: [make_reading(1, 5)])
+        cache.get(1)
+
+        def invalidating_fetch(since, sensor_id):
+            cache.invalidate()
+            return [make_reading(2, 5)]
+
+        cache._fetch = invalidating_fetch
+        result = []
+        reader = threading.Thread(target=lambda: result.extend(cache.get(1)), daemon=True)
+        reader.start()
+        reader.join(2)
+        self.assertFalse(reader.is_alive(), "history read deadlocked")
+        self.assertEqual([r['_id'] for r in result], ['2'])
+
+        cache._fetch = lambda since, sensor_id: [make_reading(3, 5)]
+        self.assertEqual([r['_id'] for r in cache.get(1)], ['3'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+"""
+Tests for the version 2 sensor schema translation. They need no MongoDB:
+    python -m unittest discover tests
+"""
+import unittest
+from datetime import datetime
+
+from sensor_schema import _packed_filter_and_update, decode_document
+
+
+class StubRegistry:
+    def describe(self, ref):
+        return ('SENSOR_001', 'Tank A')
+
+
+class PackedSchemaTest(unittest.TestCase):
+
+    def test_only_migration_copies_are_deduplicated(self):
+        reading = {'_id': 'a1', 'timestamp': datetime(2025, 1, 1, 12, 0, 5), 'ph': 7.1}
+        copy_filter, copy_update = _packed_filter_and_update(reading, 1, 3600, deduplicate=True)
+        live_filter, live_update = _packed_filter_and_update(reading, 1, 3600, deduplicate=False)
+        self.assertEqual(copy_filter, {'_id': live_filter['_id'], 'src': {'$ne': 'a1'}})
+        self.assertEqual(copy_update['$push']['src'], 'a1')
+        self.assertEqual(live_filter, {'_id': '1:1735732800'})
+        self.assertNotIn('src', live_update['$push'])
+
+    def test_migration_copies_in_the_same_second_are_both_kept(self):
+        # Copies are told apart by their version 1 _id, not their offset
+        first = {'_id': 'a1', 'timestamp': datetime(2025, 1, 1, 12, 0, 5), 'ph': 7.1}
+        second = dict(first, _id='a2', ph=7.2)
+        first_filter, _ = _packed_filter_and_update(first, 1, 3600, deduplicate=True)
+        second_filter, _ = _packed_filter_and_update(second, 1, 3600, deduplicate=True)
+        self.assertEqual(first_filter['_id'], second_filter['_id'])
+        self.assertNotEqual(first_filter, second_filter)
+
+    def test_readings_in_the_same_second_keep_distinct_ids(self):
+        bucket = {'_id': '1:1735732800', 's': 1, 't': 1735732800,
+                  'dt': [5, 5, 3], 'ph': [7.1, 7.2, 7.0]}
+        readings = decode_document(bucket, StubRegistry())
+        self.assertEqual([r['ph'] for r in readings], [7.0, 7.1, 7.2])
+        self.assertEqual(len({r['_id'] for r in readings}), 3)
+        self.assertEqual(readings[0]['_id'], '1:1735732800:2')
+
+
+if __name__ == '__main__':
+    unittest.main()